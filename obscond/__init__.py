@@ -4,7 +4,20 @@ from .io import *
 from .historicalWeatherData import *
 from .constants import *
 from .atmosphere import *
+from .coordinates import *
+from .seeingmodel import *
+from .skymaps import *
+from .pipeline import *
+from .parquetio import *
+from .resultstore import *
+from .opsimreader import *
+from .shareddata import *
+from .service import *
+from .synthetic import *
+from .validation import *
+from .batchphotometry import *
 from .skybrightness import *
+from .observablemaps import *
 from .version import __version__
 dirname = os.path.dirname(os.path.abspath(__file__))
 example_data_dir =  os.path.join(dirname, 'example_data')
@@ -26,6 +26,9 @@ class AirmassDependentBandpass(object):
             `lsst.sims.Bandpass` object`
 	"""
         self.hwbandpassDict = hwBandpassDict
+        # Bandpasses are only read once for each band and atmosphere file,
+        # and are shared (read only) between callers
+        self._bandpassCache = dict()
 
     @classmethod
     def fromThroughputs(cls):
@@ -71,9 +74,13 @@ class AirmassDependentBandpass(object):
             value of airmass for which we want to obtain the bandpass
         """
         fname = self.atmTransName(airmass)
-        atmTrans = np.loadtxt(fname)
-        wave, trans = self.hwbandpassDict[bandname].multiplyThroughputs(atmTrans[:, 0],
-								  atmTrans[:, 1])
-
-        return Bandpass(wavelen=wave, sb=trans)
+        key = (bandname, fname)
+        bp = self._bandpassCache.get(key)
+        if bp is None:
+            atmTrans = np.loadtxt(fname)
+            wave, trans = self.hwbandpassDict[bandname].multiplyThroughputs(atmTrans[:, 0],
+								      atmTrans[:, 1])
+            bp = Bandpass(wavelen=wave, sb=trans)
+            self._bandpassCache[key] = bp
+        return bp
 
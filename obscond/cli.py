@@ -0,0 +1,210 @@
+"""
+Command line interface of `obscond`, installed as the `obscond` script and
+also available as `python -m obscond`.
+
+    obscond recalc --input minion_1016_sqlite.db --output results \\
+        --chunksize 5000 --workers 32 --shard 3/10
+
+recalculates the sky brightness, five sigma depths and coordinates of the
+pointings of an OpSim output, and
+
+    obscond serve --address /tmp/obscond.sock
+
+runs a `ConditionsServer`. A server on a port requires an authentication
+key, eg. `--address localhost:5005 --authkey-file ~/.obscond_authkey`.
+"""
+from __future__ import absolute_import, division, print_function
+__all__ = ['main']
+
+import argparse
+import sys
+
+
+def parseShard(s):
+    """
+    parse a shard specification 'i/N' into the tuple (i, N)
+    """
+    try:
+        i, n = (int(x) for x in s.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('shard must be of the form i/N')
+    if n < 1 or not 0 <= i < n:
+        raise argparse.ArgumentTypeError('shard i/N requires 0 <= i < N')
+    return i, n
+
+
+def parseExtraCoords(s):
+    """
+    parse 'prefix=raCol,decCol' into the tuple (prefix, (raCol, decCol))
+    """
+    try:
+        prefix, cols = s.split('=')
+        raCol, decCol = cols.split(',')
+    except ValueError:
+        raise argparse.ArgumentTypeError('extra coordinates must be of the '
+                                         'form prefix=raCol,decCol')
+    return prefix, (raCol, decCol)
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='obscond')
+    subparsers = parser.add_subparsers(dest='command')
+
+    recalc = subparsers.add_parser('recalc',
+                                   help='recalculate sky brightness and '
+                                   'depths for the pointings of an OpSim '
+                                   'output')
+    recalc.add_argument('--input', required=True,
+                        help='OpSim output sqlite database')
+    recalc.add_argument('--output', required=True,
+                        help='output Parquet dataset directory, or hdf file')
+    recalc.add_argument('--format', choices=('parquet', 'hdf'),
+                        default='parquet', help='output format')
+    recalc.add_argument('--chunksize', type=int, default=5000,
+                        help='number of pointings in each chunk')
+    recalc.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes, defaults to the '
+                        'number of CPUs')
+    recalc.add_argument('--shard', type=parseShard, default=None,
+                        help='i/N: only process pointings with '
+                        'obsHistID %% N == i')
+    recalc.add_argument('--nights', type=int, nargs=2, default=None,
+                        metavar=('FIRST', 'LAST'),
+                        help='range of nights to process')
+    recalc.add_argument('--filters', default=None,
+                        help='bands to process, eg. ri')
+    recalc.add_argument('--extra-coords', type=parseExtraCoords,
+                        action='append', default=None,
+                        help='additional positions as '
+                        'prefix=raCol,decCol, eg. '
+                        'dithered=ditheredRA,ditheredDec')
+    recalc.add_argument('--shared-data', default=None,
+                        help='directory used to share the sky model '
+                        'between the workers through memory maps')
+    recalc.add_argument('--compact', action='store_true',
+                        help='store results as float32')
+    recalc.add_argument('--coordinate-tier', default='precise',
+                        choices=('precise', 'approximate', 'fast'),
+                        help='accuracy of the coordinate transformations')
+
+    serve = subparsers.add_parser('serve', help='run a conditions server')
+    serve.add_argument('--address', required=True,
+                       help='Unix socket path, or localhost:port')
+    serve.add_argument('--authkey-file', default=None,
+                       help='file holding the key clients must provide, '
+                            'generated (mode 0600) if it does not exist. '
+                            'Required for localhost:port unless --authkey '
+                            'is given')
+    serve.add_argument('--authkey', default=None,
+                       help='key clients must provide (visible to other '
+                            'users in the process list, prefer '
+                            '--authkey-file)')
+    serve.add_argument('--max-batch-size', type=int, default=1000)
+    serve.add_argument('--max-delay', type=float, default=0.005,
+                       help='seconds for which requests wait for a batch')
+    serve.add_argument('--coordinate-tier', default='precise',
+                       choices=('precise', 'approximate', 'fast'),
+                       help='accuracy of the coordinate transformations')
+    return parser
+
+
+def recalc(args):
+    """
+    run the `recalc` command with the parsed arguments `args`
+    """
+    import pandas as pd
+    from .opsimreader import pointingColumns, readOpSimPointings
+    from .pipeline import calculatePointingsPipelined
+
+    extraCoordCols = None
+    columns = list(pointingColumns) + ['night']
+    if args.extra_coords:
+        extraCoordCols = dict(args.extra_coords)
+        for raCol, decCol in extraCoordCols.values():
+            columns += [raCol, decCol]
+
+    chunks = readOpSimPointings(args.input, columns=columns,
+                                chunksize=args.chunksize,
+                                nightRange=args.nights,
+                                filters=args.filters, shard=args.shard)
+    calcKwargs = dict(extraCoordCols=extraCoordCols, compact=args.compact,
+                      passThroughCols=['night'])
+
+    store = None
+    if args.format == 'parquet':
+        from .parquetio import PartitionedResultsWriter
+        writer = PartitionedResultsWriter(args.output)
+    else:
+        store = pd.HDFStore(args.output, mode='w')
+
+        def writer(j, df):
+            store.append('0', df)
+
+    try:
+        skyCalcKwargs = dict(photparams='LSST',
+                             coordinateTier=args.coordinate_tier)
+        summary = calculatePointingsPipelined(chunks, writer,
+                                              numWorkers=args.workers,
+                                              skyCalcKwargs=skyCalcKwargs,
+                                              calcKwargs=calcKwargs,
+                                              sharedDataDir=args.shared_data)
+    finally:
+        if store is not None:
+            store.close()
+
+    rate = summary['numRows'] / max(summary['time'], 1.0e-9)
+    print('obscond recalc: {0} pointings in {1} chunks in {2:.1f} s '
+          '({3:.1f} pointings/s)'.format(summary['numRows'],
+                                         summary['numChunks'],
+                                         summary['time'], rate))
+    return 0
+
+
+def serve(args):
+    """
+    run the `serve` command with the parsed arguments `args`
+    """
+    from lsst.sims.photUtils import BandpassDict
+    from .skybrightness import SkyCalculations
+    from .service import ConditionsServer
+
+    address = args.address
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        address = (host, int(port))
+    authkey = None
+    if args.authkey is not None:
+        authkey = args.authkey.encode('utf-8')
+    if isinstance(address, tuple) and authkey is None and \
+            args.authkey_file is None:
+        print('obscond serve: --authkey-file or --authkey is required to '
+              'listen on a port', file=sys.stderr)
+        return 2
+    _, hwbpdict = BandpassDict.loadBandpassesFromFiles()
+    skycalc = SkyCalculations(photparams='LSST', hwBandpassDict=hwbpdict,
+                              coordinateTier=args.coordinate_tier)
+    server = ConditionsServer(skycalc, address, authkey=authkey,
+                              authkeyFile=args.authkey_file,
+                              maxBatchSize=args.max_batch_size,
+                              maxDelay=args.max_delay)
+    print('obscond serve: listening on {}'.format(args.address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.close()
+    return 0
+
+
+def main(argv=None):
+    parser = _parser()
+    args = parser.parse_args(argv)
+    if args.command == 'recalc':
+        return recalc(args)
+    if args.command == 'serve':
+        return serve(args)
+    parser.print_help()
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
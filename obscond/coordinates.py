@@ -0,0 +1,213 @@
+"""
+Fast approximate coordinate calculations, vectorized over arrays of
+pointings. These are meant for cheap bulk decisions (eg. whether a pointing
+is worth sending through the sky model at all) and not as replacements for
+the precise transformations used by `sims_skybrightness`.
+"""
+from __future__ import absolute_import, division, print_function
+__all__ = ['approxSunRaDec', 'approxLST', 'approxAltAz', 'fastAltAz',
+           'airmassFromAltitude', 'observableMask']
+
+import numpy as np
+from lsst.sims.utils import approx_RaDec2AltAz
+
+
+def approxSunRaDec(mjd):
+    """
+    Low precision (~0.01 degrees) geocentric RA and Dec of the sun, referred
+    to the equinox of date, using the approximate solar coordinates of the
+    Astronomical Almanac.
+
+    Parameters
+    ----------
+    mjd : float or array-like
+        times in MJD
+
+    Returns
+    -------
+    ra : degrees
+    dec : degrees
+    """
+    n = np.asarray(mjd, dtype=np.float64) - 51544.5
+    meanLon = np.radians(280.460 + 0.9856474 * n)
+    meanAnomaly = np.radians(357.528 + 0.9856003 * n)
+    eclLon = meanLon + np.radians(1.915 * np.sin(meanAnomaly) +
+                                  0.020 * np.sin(2.0 * meanAnomaly))
+    obliquity = np.radians(23.439 - 4.0e-7 * n)
+
+    ra = np.arctan2(np.cos(obliquity) * np.sin(eclLon), np.cos(eclLon))
+    dec = np.arcsin(np.sin(obliquity) * np.sin(eclLon))
+    return np.degrees(ra) % 360.0, np.degrees(dec)
+
+
+def approxLST(mjd, longitude):
+    """
+    Approximate local mean sidereal time, ignoring the difference between
+    UT1 and UTC.
+
+    Parameters
+    ----------
+    mjd : float or array-like
+        times in MJD
+    longitude : float, degrees
+        east longitude of the site
+
+    Returns
+    -------
+    lst : degrees, in [0, 360)
+    """
+    mjd = np.asarray(mjd, dtype=np.float64)
+    gmst = 280.46061837 + 360.98564736629 * (mjd - 51544.5)
+    return (gmst + longitude) % 360.0
+
+
+def approxAltAz(ra, dec, mjd, site):
+    """
+    Approximate altitude and azimuth of positions at times `mjd`, ignoring
+    precession since J2000, nutation, aberration and refraction. Compared to
+    astropy's `AltAz` frame with the weather of the LSST site, the error in
+    the position of pointings with airmass below 2.5 is dominated by
+    precession and grows from 0.3 degrees in 2022 to 0.47 degrees in 2032,
+    and the airmass is within 2 percent.
+
+    Parameters
+    ----------
+    ra : float or array-like, degrees
+        RA of the positions
+    dec : float or array-like, degrees
+        Dec of the positions
+    mjd : float or array-like
+        times in MJD
+    site : `lsst.sims.utils.Site` instance
+        site of the observatory
+
+    Returns
+    -------
+    alt : degrees
+    az : degrees
+    """
+    ra = np.ravel(ra)
+    dec = np.ravel(dec)
+    mjd = np.ravel(mjd)
+    return approx_RaDec2AltAz(ra=ra, dec=dec, lat=site.latitude,
+                              lon=site.longitude, mjd=mjd, lmst=None)
+
+
+def _precessFromJ2000(ra, dec, mjd):
+    """
+    RA and Dec in radians precessed from the mean equator and equinox of
+    J2000 to those of the dates `mjd`, with the IAU 1976 precession angles
+    (Lieske et al. 1977), ignoring the difference between TT and UTC
+    """
+    t = (mjd - 51544.5) / 36525.0
+    arcsec = np.pi / 180.0 / 3600.0
+    zeta = (2306.2181 + (0.30188 + 0.017998 * t) * t) * t * arcsec
+    z = (2306.2181 + (1.09468 + 0.018203 * t) * t) * t * arcsec
+    theta = (2004.3109 - (0.42665 + 0.041833 * t) * t) * t * arcsec
+    a = np.cos(dec) * np.sin(ra + zeta)
+    b = np.cos(theta) * np.cos(dec) * np.cos(ra + zeta) - \
+        np.sin(theta) * np.sin(dec)
+    c = np.sin(theta) * np.cos(dec) * np.cos(ra + zeta) + \
+        np.cos(theta) * np.sin(dec)
+    return np.arctan2(a, b) + z, np.arcsin(np.clip(c, -1.0, 1.0))
+
+
+def fastAltAz(ra, dec, mjd, site, ofDate=False):
+    """
+    Altitude and azimuth of positions at times `mjd` from hour angles with
+    respect to the mean sidereal time of `approxLST`, evaluated for all
+    positions at once. The positions are precessed to the mean equinox of
+    date, but nutation, aberration and refraction are ignored. Compared to
+    astropy's `AltAz` frame with the weather of the LSST site, for pointings
+    with airmass below 2.5 between 2022 and 2032, the position is within
+    0.04 degrees (0.01 degrees without refraction) and the airmass within
+    0.15 percent.
+
+    Parameters
+    ----------
+    ra : float or array-like, degrees
+        RA of the positions
+    dec : float or array-like, degrees
+        Dec of the positions
+    mjd : float or array-like
+        times in MJD
+    site : `lsst.sims.utils.Site` instance
+        site of the observatory
+    ofDate : Bool, defaults to `False`
+        if `True`, `ra` and `dec` are already referred to the equinox of
+        date (eg. those of `approxSunRaDec`) and are not precessed
+
+    Returns
+    -------
+    alt : degrees
+    az : degrees, east of north
+    """
+    mjd = np.ravel(mjd)
+    ra = np.radians(np.ravel(ra))
+    dec = np.radians(np.ravel(dec))
+    if not ofDate:
+        ra, dec = _precessFromJ2000(ra, dec, mjd)
+    lat = np.radians(site.latitude)
+    hourAngle = np.radians(approxLST(mjd, site.longitude)) - ra
+    sinAlt = np.sin(dec) * np.sin(lat) + \
+        np.cos(dec) * np.cos(lat) * np.cos(hourAngle)
+    alt = np.arcsin(np.clip(sinAlt, -1.0, 1.0))
+    az = np.arctan2(-np.cos(dec) * np.sin(hourAngle),
+                    np.sin(dec) * np.cos(lat) -
+                    np.cos(dec) * np.sin(lat) * np.cos(hourAngle))
+    return np.degrees(alt), np.degrees(az) % 360.0
+
+
+def airmassFromAltitude(alt):
+    """
+    Plane parallel airmass for altitudes `alt` in degrees. Positions at or
+    below the horizon are assigned an airmass of `np.inf`.
+    """
+    alt = np.radians(np.asarray(alt, dtype=np.float64))
+    sinAlt = np.sin(alt)
+    with np.errstate(divide='ignore'):
+        return np.where(sinAlt > 0., 1.0 / sinAlt, np.inf)
+
+
+def observableMask(ra, dec, mjd, site, airmassLimit=None, maxSunAlt=None,
+                   fast=False):
+    """
+    Boolean mask of pointings which are below the airmass limit and taken
+    while the sun is below `maxSunAlt`. Since the calculation is approximate,
+    pointings within the errors of `approxAltAz` (up to half a degree) or
+    `fastAltAz` (0.04 degrees) of either limit may be misclassified.
+
+    Parameters
+    ----------
+    ra : array-like, radians
+        RA of the pointings
+    dec : array-like, radians
+        Dec of the pointings
+    mjd : array-like
+        times of the pointings in MJD
+    site : `lsst.sims.utils.Site` instance
+        site of the observatory
+    airmassLimit : float, defaults to `None`
+        pointings with a larger airmass are masked. If `None`, no airmass
+        cut is applied
+    maxSunAlt : float, degrees, defaults to `None`
+        pointings at times when the sun altitude is larger are masked. If
+        `None`, no cut on the sun altitude is applied
+    fast : Bool, defaults to `False`
+        if `True`, use `fastAltAz` rather than `approxAltAz`
+    """
+    altAz = fastAltAz if fast else approxAltAz
+    mjd = np.ravel(mjd)
+    mask = np.ones(len(mjd), dtype=bool)
+    if airmassLimit is not None:
+        alt, _ = altAz(np.degrees(ra), np.degrees(dec), mjd, site)
+        mask &= airmassFromAltitude(alt) <= airmassLimit
+    if maxSunAlt is not None:
+        # the coordinates of the sun are referred to the equinox of date
+        sunRA, sunDec = approxSunRaDec(mjd)
+        if fast:
+            sunAlt, _ = fastAltAz(sunRA, sunDec, mjd, site, ofDate=True)
+        else:
+            sunAlt, _ = approxAltAz(sunRA, sunDec, mjd, site)
+        mask &= sunAlt <= maxSunAlt
+    return mask
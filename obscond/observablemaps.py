@@ -0,0 +1,176 @@
+"""
+Survey wide maps of the number of hours for which each point of the sky is
+observable in each night, on HEALPix pixels, stored in a memory mapped file.
+The ephemerides of the sun and the moon, which only depend on time, are
+calculated once with `ObservationPotential` and shared by all the pixels,
+and the sky is processed in blocks of pixels and times, so that memory is
+bounded by the size of the blocks.
+"""
+from __future__ import absolute_import, division, print_function
+__all__ = ['ObservableHoursMaps']
+
+import os
+import json
+import numpy as np
+import healpy as hp
+
+
+class ObservableHoursMaps(object):
+    """
+    Observable hours in nights `firstNight` to `firstNight + numNights - 1`
+    for each pixel of a HEALPix map of resolution `nside`, stored in
+    `mapDir` as a float32 array of shape (number of nights, number of
+    pixels). The hours are the number of samples of the time grid of
+    spacing `dt` meeting the constraints, multiplied by `dt`, so that they
+    are accurate to about `dt` per night.
+
+    Parameters
+    ----------
+    mapDir : string
+        directory holding the memory mapped maps
+    firstNight : int
+        first night of the maps
+    numNights : int
+        number of nights
+    nside : int
+        HEALPix nside of the maps
+    mode : string, defaults to 'r'
+        mode used to open the memory mapped file
+    kwargs :
+        parameters of the calculation, stored as attributes
+    """
+    metadataFile = 'observablehours.json'
+    mapFile = 'observablehours.dat'
+
+    def __init__(self, mapDir, firstNight, numNights, nside, mode='r',
+                 **kwargs):
+        self.mapDir = mapDir
+        self.firstNight = firstNight
+        self.numNights = numNights
+        self.nside = nside
+        self.npix = hp.nside2npix(nside)
+        self.params = kwargs
+        self.hours = np.memmap(os.path.join(mapDir, self.mapFile),
+                               dtype=np.float32, mode=mode,
+                               shape=(numNights, self.npix))
+
+    @property
+    def nights(self):
+        return self.firstNight + np.arange(self.numNights)
+
+    @classmethod
+    def fromDirectory(cls, mapDir):
+        """
+        open existing maps in `mapDir` in read only mode
+        """
+        with open(os.path.join(mapDir, cls.metadataFile), 'r') as f:
+            meta = json.load(f)
+        return cls(mapDir, mode='r', **meta)
+
+    def nightMap(self, night):
+        """
+        HEALPix map of the observable hours in `night`
+        """
+        return self.hours[night - self.firstNight]
+
+    @classmethod
+    def build(cls, mapDir, mjdStart, mjdEnd, nside=32, dt=5. / 60. / 24.,
+              minAlt=30., maxSunAlt=-18., minMoonDist=None,
+              nightOffset=59579.6, observatory='LSST', pixelBlockSize=1024,
+              timeBlockSize=2048):
+        """
+        Calculate the observable hours of all pixels and write them to
+        `mapDir`.
+
+        Parameters
+        ----------
+        mapDir : string
+            directory to write to, created if it does not exist
+        mjdStart : float
+            first time in MJD
+        mjdEnd : float
+            last time in MJD
+        nside : int, defaults to 32
+            HEALPix nside of the maps
+        dt : float, unit days, defaults to 5 minutes
+            spacing of the time grid
+        minAlt : float, degrees, defaults to 30.
+            minimum altitude of the pixel
+        maxSunAlt : float, degrees, defaults to -18.
+            maximum altitude of the sun
+        minMoonDist : float, degrees, defaults to `None`
+            minimum distance from the moon while the moon is above the
+            horizon. If `None`, the moon is ignored
+        nightOffset : float, defaults to 59579.6
+            MJD of the start of night 0, as in
+            `ObservationPotential.potential_obscond`
+        observatory : string, defaults to 'LSST'
+        pixelBlockSize : int, defaults to 1024
+            number of pixels processed at once
+        timeBlockSize : int, defaults to 2048
+            number of dark times processed at once. Memory is proportional
+            to `pixelBlockSize * timeBlockSize`
+        """
+        from .observingPotential import ObservationPotential
+
+        if not os.path.exists(mapDir):
+            os.makedirs(mapDir)
+        numTimes = int(np.floor((mjdEnd - mjdStart) / dt + 1.0e-8)) + 1
+        mjds = mjdStart + dt * np.arange(numTimes)
+        nights = np.floor(mjds - nightOffset).astype(np.int64)
+        firstNight = int(nights[0])
+        numNights = int(nights[-1]) - firstNight + 1
+        meta = dict(firstNight=firstNight, numNights=numNights, nside=nside,
+                    mjdStart=mjdStart, mjdEnd=mjdEnd, dt=dt, minAlt=minAlt,
+                    maxSunAlt=maxSunAlt, minMoonDist=minMoonDist,
+                    nightOffset=nightOffset, observatory=observatory)
+        with open(os.path.join(mapDir, cls.metadataFile), 'w') as f:
+            json.dump(meta, f)
+        maps = cls(mapDir, mode='w+', **meta)
+        maps.hours[:] = 0.
+
+        # Ephemerides only depend on time: calculate them once, and only
+        # keep the dark times
+        op = ObservationPotential(0., 0., observatory=observatory)
+        dark = op.sunAlt(mjds) <= maxSunAlt
+        mjds = mjds[dark]
+        nights = nights[dark] - firstNight
+        if minMoonDist is not None and len(mjds) > 0:
+            moonRA, moonDec, moonAlt = op.moonCoords(mjds)
+            moonUp = moonAlt > 0.
+            moonRA = np.radians(moonRA)
+            moonDec = np.radians(moonDec)
+            cosMinMoonDist = np.cos(np.radians(minMoonDist))
+
+        theta, phi = hp.pix2ang(nside, np.arange(maps.npix))
+        ra = np.degrees(phi)
+        dec = 90. - np.degrees(theta)
+        hoursPerSample = np.float32(dt * 24.)
+
+        for tstart in range(0, len(mjds), timeBlockSize):
+            tblock = slice(tstart, tstart + timeBlockSize)
+            t = mjds[tblock]
+            n = nights[tblock]
+            # nights are sorted, so that samples of a night are contiguous
+            nightStarts = np.flatnonzero(np.diff(n, prepend=-1))
+            for pstart in range(0, maps.npix, pixelBlockSize):
+                pblock = slice(pstart, pstart + pixelBlockSize)
+                numPix = len(ra[pblock])
+                alt, _ = op.field_coords(np.tile(ra[pblock], len(t)),
+                                         np.tile(dec[pblock], len(t)),
+                                         np.repeat(t, numPix))
+                available = alt.reshape(len(t), numPix) >= minAlt
+                if minMoonDist is not None:
+                    r = np.radians(ra[pblock])[np.newaxis, :]
+                    d = np.radians(dec[pblock])[np.newaxis, :]
+                    cosMoonDist = np.sin(d) * \
+                        np.sin(moonDec[tblock, np.newaxis]) + \
+                        np.cos(d) * np.cos(moonDec[tblock, np.newaxis]) * \
+                        np.cos(r - moonRA[tblock, np.newaxis])
+                    available &= (cosMoonDist <= cosMinMoonDist) | \
+                        ~moonUp[tblock, np.newaxis]
+                counts = np.add.reduceat(available.astype(np.float32),
+                                         nightStarts, axis=0)
+                maps.hours[n[nightStarts], pblock] += counts * hoursPerSample
+        maps.hours.flush()
+        return cls.fromDirectory(mapDir)
@@ -10,6 +10,7 @@ import lsst.sims.skybrightness as sb
 from lsst.sims.utils import (Site, approx_RaDec2AltAz)
 import ephem
 from obscond import SkyCalculations as sm
+from .seeingmodel import addSeeingConditions
 
 
 from lsst.sims.utils import angularSeparation
@@ -167,7 +168,7 @@ class ObservationPotential(object):
                        moonRA=moonra,
                        moonDec=moondec,
                        moonAlt=moonalt,
-                       night=np.floor(t-59579.6).astype(np.int)))
+                       night=np.floor(t - nightOffset).astype(np.int64)))
 
         df['moonDist'] = angularSeparation(moonra, moondec,
                                            np.degrees(self.ra),
@@ -175,6 +176,43 @@ class ObservationPotential(object):
         
         return df
     
+    def potential_obscond_blocks(self, t, fieldRA, fieldDec,
+                                 constraints=None, blockSize=10000,
+                                 nightOffset=59579.6):
+        """
+        Generator of the observing conditions of `potential_obscond` for
+        blocks of `blockSize` consecutive times of `t`, keeping only the rows
+        satisfying `constraints`, so that memory is set by `blockSize` rather
+        than the length of `t`.
+
+        Parameters
+        ----------
+        t : array-like
+            increasing times in MJD
+        fieldRA : RA, degree
+        fieldDec : Dec, degree
+        constraints : string, defaults to `None`
+            query on the columns of `potential_obscond`, as in
+            `available_times`, eg. 'alt > 30. and sunAlt < -18.'. If `None`,
+            all rows are kept
+        blockSize : int, defaults to 10000
+            number of times in each block
+        nightOffset : mjd value, defaults to 59579.6
+            mjd value for night = 0 of the survey.
+
+        Returns
+        -------
+        generator of `pd.DataFrame`, possibly empty
+        """
+        t = np.ravel(t)
+        for start in range(0, len(t), blockSize):
+            df = self.potential_obscond(t[start:start + blockSize],
+                                        fieldRA, fieldDec,
+                                        nightOffset=nightOffset)
+            if constraints is not None:
+                df = df.query(constraints)
+            yield df
+
     def available_times(self, potential_times, constraints):
         """returns available times 
         """
@@ -214,7 +252,7 @@ class ObservationPotential(object):
         # Iterate through the standard list of band, standard visit sequences
         # For on and off years
         for band, visits, morevisits in zip(list('rgizy'), seq, extravisits):
-            numVisits = np.floor(visits * fraction) + morevisits
+            numVisits = int(np.floor(visits * fraction) + morevisits)
             times = np.linspace(time, time + (numVisits - 1) * 38 * sec,
                                 numVisits)
             l.append(times)
@@ -226,8 +264,18 @@ class ObservationPotential(object):
         return df, visitlist
     
     @staticmethod
-    def dc2_visits(start_times, year_block, delta=1, pointings=None):
-        
+    def dc2_visits(start_times, year_block, delta=1, pointings=None,
+                   weatherData=None, fieldRA=None, fieldDec=None,
+                   surveyStart=59580., observatory='LSST'):
+        """
+        Visits of DC2 sequences starting at `start_times`. If `weatherData`
+        is given, the airmass, raw seeing, FWHMeff and FWHMgeom of the
+        visits to the field at `fieldRA`, `fieldDec` (radians) are added.
+        Otherwise, if `pointings` is given, the raw seeing of the nearest
+        pointing in time is added, along with the approximate altitude and
+        azimuth (degrees) of the field at `observatory` if `fieldRA` and
+        `fieldDec` are given.
+        """
         vs = []
         for st in start_times.values:
             df, vl = ObservationPotential.dc2_sequence(st, year_block, delta)
@@ -235,29 +283,141 @@ class ObservationPotential(object):
         df = pd.concat(vs)
         df['night'] = np.floor(df.expMJD - 59579.6)
 
-        if pointings is not None:
+        if weatherData is not None:
+            if fieldRA is None or fieldDec is None:
+                raise ValueError('fieldRA and fieldDec are required to add '
+                                 'the seeing conditions from weatherData')
+            df['fieldRA'] = fieldRA
+            df['fieldDec'] = fieldDec
+            df = addSeeingConditions(df, weatherData,
+                                     surveyStart=surveyStart)
+        elif pointings is not None:
             rawSeeing = interp1d(pointings.expMJD.values,
                                  pointings.rawSeeing.values,
                                  kind='nearest')
 
             df['rawSeeing'] = rawSeeing(df.expMJD.values)
-            alt, az = approx_RaDec2AltAz(ra=ra, dec=dec,
-                                         lat=self.site.latitude,
-                                         lon=self.site.longitude,
-                                         mjd=df.expMJD.values,
-                                         lmst=None)
-            df['alt'] = alt
-            df['az'] = az
-   
+            if fieldRA is not None and fieldDec is not None:
+                site = Site(observatory)
+                num = len(df)
+                alt, az = approx_RaDec2AltAz(
+                    ra=np.repeat(np.degrees(fieldRA), num),
+                    dec=np.repeat(np.degrees(fieldDec), num),
+                    lat=site.latitude, lon=site.longitude,
+                    mjd=df.expMJD.values, lmst=None)
+                df['alt'] = alt
+                df['az'] = az
+
         return df
     
     @staticmethod
-    def nightStats(availabletimes):
-        df = availabletimes.groupby('night').agg(dict(mjd=(min, max))).reset_index()
-        df = pd.DataFrame(df.values, columns=('night', 'minmjd', 'maxmjd'))
-        df['availTime'] = (df.maxmjd - df.minmjd) * 24.0
-        return df.set_index('night')
-        
+    def nightStats(availabletimes, maxGap=None):
+        """
+        Statistics of the available times in each night, in one pass over
+        the times sorted by night.
+
+        Parameters
+        ----------
+        availabletimes : `pd.DataFrame` with columns `night` and `mjd`
+            available times, eg. the output of `available_times`
+        maxGap : float, unit days, defaults to `None`
+            consecutive times of a night separated by more than `maxGap`
+            belong to different windows. If `None`, 1.5 times the median
+            spacing of the times is used
+
+        Returns
+        -------
+        `pd.DataFrame` indexed by night with columns `minmjd`, `maxmjd`,
+        `availTime` (hours between the first and last available times),
+        `numWindows` (number of contiguous windows of available times) and
+        `windowTime` (hours within the windows)
+        """
+        columns = ['minmjd', 'maxmjd', 'availTime', 'numWindows',
+                   'windowTime']
+        night = availabletimes.night.values
+        mjd = availabletimes.mjd.values
+        if len(mjd) == 0:
+            return pd.DataFrame(columns=columns,
+                                index=pd.Index([], name='night'))
+        if np.any(np.diff(night) < 0) or np.any(np.diff(mjd) < 0):
+            order = np.lexsort((mjd, night))
+            night = night[order]
+            mjd = mjd[order]
+
+        starts = np.flatnonzero(np.diff(night, prepend=night[0] - 1))
+        steps = np.diff(mjd, prepend=mjd[0])
+        steps[starts] = 0.
+        if maxGap is None:
+            positive = steps[steps > 0.]
+            maxGap = 1.5 * np.median(positive) if len(positive) else 0.
+        gaps = steps > maxGap
+        gaps[starts] = True
+
+        minmjd = np.minimum.reduceat(mjd, starts)
+        maxmjd = np.maximum.reduceat(mjd, starts)
+        numWindows = np.add.reduceat(gaps.astype(np.int64), starts)
+        gapTime = np.add.reduceat(np.where(gaps, steps, 0.), starts)
+        availTime = (maxmjd - minmjd) * 24.0
+        df = pd.DataFrame(dict(minmjd=minmjd, maxmjd=maxmjd,
+                               availTime=availTime, numWindows=numWindows,
+                               windowTime=availTime - gapTime * 24.0),
+                          columns=columns,
+                          index=pd.Index(night[starts], name='night'))
+        return df
+
+    @staticmethod
+    def nightStatsFromBlocks(blocks, maxGap):
+        """
+        `nightStats` of the concatenation of `blocks`, folding each block
+        into the statistics as it arrives, eg. the output of
+        `potential_obscond_blocks`. Memory is set by the size of a block and
+        the number of nights.
+
+        Parameters
+        ----------
+        blocks : iterable of `pd.DataFrame` with columns `night` and `mjd`
+            available times, in increasing order of times across blocks
+        maxGap : float, unit days
+            consecutive times of a night separated by more than `maxGap`
+            belong to different windows, typically 1.5 times the spacing of
+            the times
+
+        Returns
+        -------
+        `pd.DataFrame` with the columns of `nightStats`
+        """
+        stats = []
+        lastNight = None
+        lastMjd = None
+        for df in blocks:
+            if len(df) == 0:
+                continue
+            block = ObservationPotential.nightStats(df, maxGap=maxGap)
+            first = block.index[0]
+            if stats and first == lastNight:
+                # the first night of the block continues the last one
+                prev = stats[-1]
+                cur = block.loc[first]
+                gap = cur.minmjd - lastMjd
+                joined = gap <= maxGap
+                windowTime = prev.windowTime.iloc[-1] + cur.windowTime + \
+                    (gap * 24.0 if joined else 0.)
+                numWindows = prev.numWindows.iloc[-1] + cur.numWindows - \
+                    int(joined)
+                minmjd = prev.minmjd.iloc[-1]
+                block.loc[first, 'minmjd'] = minmjd
+                block.loc[first, 'availTime'] = (cur.maxmjd - minmjd) * 24.0
+                block.loc[first, 'numWindows'] = numWindows
+                block.loc[first, 'windowTime'] = windowTime
+                stats[-1] = prev.iloc[:-1]
+            stats.append(block)
+            lastNight = block.index[-1]
+            lastMjd = block.maxmjd.iloc[-1]
+        if not stats:
+            return ObservationPotential.nightStats(pd.DataFrame(dict(night=[],
+                                                                     mjd=[])))
+        return pd.concat(stats)
+
     @staticmethod
     def start_times(nightStats, chosen_nights, rng):
         zz = nightStats
@@ -269,4 +429,4 @@ class ObservationPotential(object):
     
     @staticmethod
     def timerange(series):
-        return (max(series) - min(series))*24.0
+        return np.ptp(np.asarray(series)) * 24.0
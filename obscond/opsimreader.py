@@ -0,0 +1,107 @@
+"""
+Reader for pointings in OpSim output databases, which only reads the columns
+used in the calculations, in chunks, straight from SQLite.
+"""
+from __future__ import absolute_import, division, print_function
+__all__ = ['pointingColumns', 'readOpSimPointings']
+
+import sqlite3
+import numpy as np
+import pandas as pd
+
+# Columns of the OpSim Summary table used by
+# `SkyCalculations.calculatePointings`
+pointingColumns = ('fieldRA', 'fieldDec', 'filter', 'expMJD', 'FWHMeff')
+
+
+def readOpSimPointings(dbname, columns=pointingColumns, chunksize=100000,
+                       nightRange=None, filters=None, propIDs=None,
+                       shard=None, tableName='Summary',
+                       indexCol='obsHistID', unique=True):
+    """
+    Generator of chunks of pointings from an OpSim (v3) output database,
+    eg. `minion_1016_sqlite.db`. Only the requested columns are read, so
+    that load time and memory scale with the number of columns used rather
+    than the width of the table.
+
+    Parameters
+    ----------
+    dbname : string
+        OpSim sqlite database file
+    columns : sequence of strings, defaults to `pointingColumns`
+        columns to read
+    chunksize : int, defaults to 100000
+        number of pointings in each chunk
+    nightRange : tuple of ints, defaults to `None`
+        (first, last) nights to read, both included
+    filters : sequence of strings, defaults to `None`
+        bands to read, eg. `['r', 'i']`
+    propIDs : sequence of ints, defaults to `None`
+        proposals to read
+    shard : tuple of ints, defaults to `None`
+        (i, N) reads only pointings with `indexCol % N == i`, for a
+        partitioning of the pointings which does not depend on the chunks
+    tableName : string, defaults to 'Summary'
+    indexCol : string, defaults to 'obsHistID'
+        column used as the index of the chunks
+    unique : Bool, defaults to `True`
+        if `True`, a pointing which is listed under several proposals is
+        only read once
+
+    Returns
+    -------
+    generator of `pd.DataFrame` indexed by `indexCol`, ordered by `indexCol`
+    """
+    conn = sqlite3.connect(dbname)
+    try:
+        info = conn.execute('PRAGMA table_info({})'.format(tableName))
+        tableCols = list(row[1] for row in info)
+        if not tableCols:
+            raise ValueError('table {0} not found in {1}\n'.format(tableName,
+                                                                   dbname))
+        columns = list(col for col in columns if col != indexCol)
+        unknown = set(columns + [indexCol]) - set(tableCols)
+        if unknown:
+            raise ValueError('columns {} not in table\n'.format(
+                sorted(unknown)))
+
+        conditions = []
+        params = []
+        if nightRange is not None:
+            conditions.append('night BETWEEN ? AND ?')
+            params += [int(nightRange[0]), int(nightRange[1])]
+        if filters is not None:
+            filters = list(filters)
+            conditions.append('filter IN ({})'.format(
+                ','.join('?' * len(filters))))
+            params += filters
+        if propIDs is not None:
+            propIDs = list(int(propID) for propID in propIDs)
+            conditions.append('propID IN ({})'.format(
+                ','.join('?' * len(propIDs))))
+            params += propIDs
+        if shard is not None:
+            conditions.append('{} % ? = ?'.format(indexCol))
+            params += [int(shard[1]), int(shard[0])]
+
+        query = 'SELECT {0} FROM {1}'.format(', '.join([indexCol] + columns),
+                                             tableName)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        if unique:
+            query += ' GROUP BY {}'.format(indexCol)
+        query += ' ORDER BY {}'.format(indexCol)
+
+        cursor = conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunksize)
+            if not rows:
+                break
+            values = list(zip(*rows))
+            data = dict((col, np.array(values[i + 1]))
+                        for i, col in enumerate(columns))
+            index = pd.Index(np.array(values[0], dtype=np.int64),
+                             name=indexCol)
+            yield pd.DataFrame(data, index=index, columns=columns)
+    finally:
+        conn.close()
@@ -0,0 +1,121 @@
+"""
+Columnar, compressed and partitioned storage of the results of
+`SkyCalculations.calculatePointings` in Parquet datasets, which can be
+appended to chunk by chunk and read back by column and partition.
+Requires `pyarrow`.
+"""
+from __future__ import absolute_import, division, print_function
+__all__ = ['PartitionedResultsWriter', 'readPartitionedResults']
+
+import uuid
+import numpy as np
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+def _requirePyarrow():
+    if pa is None:
+        raise ImportError('pyarrow is required for Parquet output\n')
+
+
+class PartitionedResultsWriter(object):
+    """
+    Append results of `calculatePointings` to a Parquet dataset in the
+    directory `rootPath`, partitioned in subdirectories by the values of
+    `partitionCols` (eg. `night=10/filter=r/`). Each call to `write` adds new
+    files, so that existing data is never rewritten.
+
+    Parameters
+    ----------
+    rootPath : string
+        directory of the dataset
+    partitionCols : sequence of strings, defaults to ('night',)
+        columns of the results used to partition the dataset. These must be
+        present in the results, eg. by using the `passThroughCols` argument
+        of `calculatePointings`
+    compression : string, defaults to 'zstd'
+        compression codec of the Parquet files
+    indexCol : string, defaults to 'obsHistID'
+        name of the column holding the index of the results
+
+    Examples
+    --------
+    The instance can be used as the writer of `calculatePointingsPipelined`
+
+    >>> writer = PartitionedResultsWriter('results') # doctest: +SKIP
+    >>> calculatePointingsPipelined(chunks, writer,
+    ...     calcKwargs=dict(passThroughCols=['night'])) # doctest: +SKIP
+    """
+    def __init__(self, rootPath, partitionCols=('night',),
+                 compression='zstd', indexCol='obsHistID'):
+        _requirePyarrow()
+        self.rootPath = rootPath
+        self.partitionCols = list(partitionCols)
+        self.compression = compression
+        self.indexCol = indexCol
+        self.numWritten = 0
+
+    def write(self, df):
+        """
+        Append the results `df` to the dataset
+        """
+        table = pa.Table.from_pandas(df.reset_index(), preserve_index=False)
+        basename = '{0}-{1}-{{i}}.parquet'.format(self.numWritten,
+                                                  uuid.uuid4().hex)
+        pq.write_to_dataset(table, self.rootPath,
+                            partition_cols=self.partitionCols,
+                            compression=self.compression,
+                            basename_template=basename)
+        self.numWritten += 1
+
+    def __call__(self, j, df):
+        self.write(df)
+
+
+def readPartitionedResults(rootPath, columns=None, nights=None, bands=None,
+                           nightCol='night', bandCol='filter',
+                           indexCol='obsHistID'):
+    """
+    Read results from a dataset written by `PartitionedResultsWriter`. Only
+    the requested columns are read, and filters on partition columns skip
+    the files of other partitions. Files are memory mapped.
+
+    Parameters
+    ----------
+    rootPath : string
+        directory of the dataset
+    columns : sequence of strings, defaults to `None`
+        columns to read, if `None` all columns are read
+    nights : sequence of ints, defaults to `None`
+        nights to read, if `None` all nights are read
+    bands : sequence of strings, defaults to `None`
+        bands to read, if `None` all bands are read
+    nightCol : string, defaults to 'night'
+    bandCol : string, defaults to 'filter'
+    indexCol : string, defaults to 'obsHistID'
+        column used as the index of the returned dataframe
+
+    Returns
+    -------
+    `pd.DataFrame`
+    """
+    _requirePyarrow()
+    filters = []
+    if nights is not None:
+        filters.append((nightCol, 'in', list(np.ravel(nights).tolist())))
+    if bands is not None:
+        filters.append((bandCol, 'in', list(bands)))
+    if columns is not None:
+        columns = list(columns)
+        if indexCol not in columns:
+            columns = [indexCol] + columns
+    table = pq.read_table(rootPath, columns=columns,
+                          filters=filters if filters else None,
+                          memory_map=True)
+    df = table.to_pandas()
+    if indexCol in df.columns:
+        df = df.set_index(indexCol)
+    return df
@@ -0,0 +1,268 @@
+"""
+Pipelined driver for bulk calculations on chunks of pointings. A reader
+thread pulls chunks from a source, a pool of worker processes does the
+calculations and a writer thread consumes the results, with bounded queues
+between the stages, so that reading the next chunk and writing previous
+results overlap with the calculations.
+"""
+from __future__ import absolute_import, division, print_function
+__all__ = ['PointingsPipeline', 'calculatePointingsPipelined']
+
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+_DONE = object()
+# seconds between checks of the other stages while waiting on a queue
+_pollInterval = 0.05
+
+
+def _put(q, item, stop):
+    """
+    put `item` in the queue `q`, unless `stop` is set while waiting for
+    room. Returns `True` if the item was put
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_pollInterval)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+class PointingsPipeline(object):
+    """
+    Run `compute` on chunks in a pool of worker processes, overlapped with a
+    reader and a writer stage.
+
+    Parameters
+    ----------
+    compute : callable
+        picklable function taking a chunk and returning a result
+    numWorkers : int, defaults to `None`
+        number of worker processes. If `None`, the number of CPUs is used
+    maxQueueSize : int, defaults to 2
+        maximum number of chunks read ahead of the workers, and of results
+        waiting to be written. Together with `numWorkers`, this bounds the
+        number of chunks held in memory
+    initializer : callable, defaults to `None`
+        function run at the start of each worker process, eg. to set up the
+        sky model once per process
+    initargs : tuple, defaults to ()
+        arguments of `initializer`
+    """
+    def __init__(self, compute, numWorkers=None, maxQueueSize=2,
+                 initializer=None, initargs=()):
+        self.compute = compute
+        self.numWorkers = numWorkers
+        self.maxQueueSize = maxQueueSize
+        self.initializer = initializer
+        self.initargs = initargs
+
+    @staticmethod
+    def _reader(chunks, readQueue, errors, stop):
+        try:
+            for j, chunk in enumerate(chunks):
+                if not _put(readQueue, (j, chunk), stop):
+                    return
+        except Exception as e:
+            errors.append(e)
+        _put(readQueue, _DONE, stop)
+
+    @staticmethod
+    def _writer(writer, writeQueue, errors):
+        while True:
+            item = writeQueue.get()
+            if item is _DONE:
+                break
+            if errors:
+                # Keep draining so that the compute stage never blocks
+                continue
+            try:
+                writer(*item)
+            except Exception as e:
+                errors.append(e)
+
+    def run(self, chunks, writer):
+        """
+        Run the pipeline
+
+        Parameters
+        ----------
+        chunks : iterable
+            source of chunks, consumed in the reader thread
+        writer : callable
+            called in the writer thread as `writer(j, result)` for the result
+            of the jth chunk, in the order in which the results complete
+
+        Returns
+        -------
+        summary : dict with the number of chunks, the total length of the
+            results and the time taken in seconds
+        """
+        tstart = time.time()
+        readQueue = queue.Queue(maxsize=self.maxQueueSize)
+        writeQueue = queue.Queue(maxsize=self.maxQueueSize)
+        errors = []
+        # set when the pipeline stops, so that the reader does not block
+        # on a full queue
+        stop = threading.Event()
+        reader = threading.Thread(target=self._reader,
+                                  args=(chunks, readQueue, errors, stop))
+        writerThread = threading.Thread(target=self._writer,
+                                        args=(writer, writeQueue, errors))
+        reader.daemon = True
+        reader.start()
+        writerThread.start()
+
+        numChunks = 0
+        numRows = 0
+        numWorkers = self.numWorkers
+        if numWorkers is None:
+            numWorkers = multiprocessing.cpu_count()
+        kwargs = dict(max_workers=numWorkers)
+        if self.initializer is not None:
+            kwargs.update(initializer=self.initializer,
+                          initargs=self.initargs)
+        try:
+            with ProcessPoolExecutor(**kwargs) as pool:
+                maxInFlight = numWorkers + self.maxQueueSize
+                inFlight = dict()
+                readingDone = False
+                while not (readingDone and not inFlight) and not errors:
+                    # submit the chunks already read, only waiting for the
+                    # reader when nothing is being calculated
+                    while not readingDone and len(inFlight) < maxInFlight:
+                        try:
+                            item = readQueue.get(timeout=_pollInterval) \
+                                if not inFlight else readQueue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if item is _DONE:
+                            readingDone = True
+                            break
+                        j, chunk = item
+                        inFlight[pool.submit(self.compute, chunk)] = j
+                    if not inFlight:
+                        continue
+                    # while more chunks may be submitted, wake up regularly
+                    # to submit them, and otherwise wait for a result
+                    timeout = None
+                    if not readingDone and len(inFlight) < maxInFlight:
+                        timeout = _pollInterval
+                    done, _ = wait(inFlight, timeout=timeout,
+                                   return_when=FIRST_COMPLETED)
+                    for future in done:
+                        j = inFlight.pop(future)
+                        result = future.result()
+                        numChunks += 1
+                        numRows += len(result)
+                        writeQueue.put((j, result))
+                for future in inFlight:
+                    future.cancel()
+        finally:
+            stop.set()
+            writeQueue.put(_DONE)
+            writerThread.join()
+        if errors:
+            raise errors[0]
+        return dict(numChunks=numChunks, numRows=numRows,
+                    time=time.time() - tstart)
+
+
+# State of the worker processes used by `calculatePointingsPipelined`
+_workerState = dict()
+
+
+def _initSkyCalculationsWorker(skyCalcKwargs, calcKwargs,
+                               sharedDataDir=None):
+    if sharedDataDir is not None:
+        from .shareddata import loadSkyCalculations
+        _workerState['skycalc'] = loadSkyCalculations(sharedDataDir)
+    else:
+        _workerState['skycalc'] = _setupSkyCalculations(skyCalcKwargs)
+    _workerState['calcKwargs'] = calcKwargs
+
+
+def _setupSkyCalculations(skyCalcKwargs):
+    from lsst.sims.photUtils import BandpassDict
+    from .skybrightness import SkyCalculations
+
+    skyCalcKwargs = dict(skyCalcKwargs)
+    if skyCalcKwargs.get('hwBandpassDict') is None:
+        _, hwbpdict = BandpassDict.loadBandpassesFromFiles()
+        skyCalcKwargs['hwBandpassDict'] = hwbpdict
+    return SkyCalculations(**skyCalcKwargs)
+
+
+def _calculateChunk(chunk):
+    skycalc = _workerState['skycalc']
+    return skycalc.calculatePointings(chunk, **_workerState['calcKwargs'])
+
+
+def calculatePointingsPipelined(chunks, writer, numWorkers=None,
+                                maxQueueSize=2, skyCalcKwargs=None,
+                                calcKwargs=None, sharedDataDir=None):
+    """
+    Run `SkyCalculations.calculatePointings` on chunks of pointings in a
+    `PointingsPipeline`, with one `SkyCalculations` instance per worker
+    process.
+
+    Parameters
+    ----------
+    chunks : iterable of `pd.DataFrame`
+        chunks of pointings
+    writer : callable
+        called as `writer(j, df)` with the results `df` of the jth chunk
+    numWorkers : int, defaults to `None`
+        number of worker processes, `None` uses the number of CPUs
+    maxQueueSize : int, defaults to 2
+        size of the queues between the stages
+    skyCalcKwargs : dict, defaults to `None`
+        keyword arguments to `SkyCalculations`. If `hwBandpassDict` is not
+        provided, the LSST hardware bandpasses are loaded in each worker.
+        Defaults to `dict(photparams='LSST')`
+    calcKwargs : dict, defaults to `None`
+        keyword arguments to `calculatePointings`
+    sharedDataDir : string, defaults to `None`
+        if provided, `SkyCalculations` is set up once in this process and
+        exported to `sharedDataDir` with `obscond.exportSkyCalculations`,
+        unless the directory already holds an export. The workers then load
+        it with memory mapped arrays shared between all of them, instead of
+        each holding a copy of the sky model and throughputs. In that case
+        `skyCalcKwargs` is only used for the export, and a `ValueError` is
+        raised if an existing export has a different `modelVersion`
+
+    Returns
+    -------
+    summary : dict, see `PointingsPipeline.run`
+    """
+    if skyCalcKwargs is None:
+        skyCalcKwargs = dict(photparams='LSST')
+    if calcKwargs is None:
+        calcKwargs = dict()
+    if sharedDataDir is not None:
+        from .shareddata import (exportSkyCalculations, isExported,
+                                 exportedVersion)
+        skycalc = _setupSkyCalculations(skyCalcKwargs)
+        if not isExported(sharedDataDir):
+            exportSkyCalculations(skycalc, sharedDataDir)
+        elif exportedVersion(sharedDataDir) != skycalc.modelVersion():
+            # workers of other runs may map the files of the export, which
+            # therefore cannot be overwritten
+            raise ValueError('{} holds an export of another model version, '
+                             'remove it or use another directory\n'.format(
+                                 sharedDataDir))
+    pipeline = PointingsPipeline(_calculateChunk, numWorkers=numWorkers,
+                                 maxQueueSize=maxQueueSize,
+                                 initializer=_initSkyCalculationsWorker,
+                                 initargs=(skyCalcKwargs, calcKwargs,
+                                           sharedDataDir))
+    return pipeline.run(chunks, writer)
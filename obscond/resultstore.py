@@ -0,0 +1,130 @@
+"""
+Persistent store of the results of `SkyCalculations.calculatePointings`,
+keyed on a hash of the inputs of each pointing and of the version of the
+models used, so that only new or changed pointings have to be recalculated.
+"""
+from __future__ import absolute_import, division, print_function
+__all__ = ['PointingResultStore']
+
+import hashlib
+import sqlite3
+import numpy as np
+
+
+class PointingResultStore(object):
+    """
+    Store of results of pointing calculations in a SQLite database. Each row
+    is keyed on a hash of the inputs of the pointing, and of a version string
+    describing the models, the throughputs, the photometric parameters and
+    the options of the calculation. Pointings whose inputs or models change
+    therefore get new keys, and are recalculated rather than read from the
+    store.
+
+    Parameters
+    ----------
+    dbname : string
+        SQLite database file, created if it does not exist
+    maxVariables : int, defaults to 900
+        maximum number of keys in a single query
+    """
+    def __init__(self, dbname, maxVariables=900):
+        self.dbname = dbname
+        self.maxVariables = maxVariables
+        self.conn = sqlite3.connect(dbname)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS results '
+                          '(key TEXT PRIMARY KEY, data BLOB)')
+        self.conn.commit()
+
+    @staticmethod
+    def pointingKeys(inputs, version):
+        """
+        Keys of pointings
+
+        Parameters
+        ----------
+        inputs : sequence of array-like
+            inputs of the pointings, each of the same length, eg.
+            (ra, dec, mjd, band, FWHMeff)
+        version : string
+            version of the models and options of the calculation
+
+        Returns
+        -------
+        keys : list of strings
+        """
+        cols = list(np.asarray(x) for x in inputs)
+        # Numerical inputs are hashed as records of fixed size. Strings are
+        # hashed with their length, so that keys do not depend on the
+        # longest string of the inputs
+        numCols = list(col for col in cols if col.dtype.kind not in 'OSU')
+        strCols = list(col for col in cols if col.dtype.kind in 'OSU')
+        dtype = list(('f{}'.format(i), col.dtype)
+                     for i, col in enumerate(numCols))
+        records = np.empty(len(cols[0]), dtype=dtype)
+        for i, col in enumerate(numCols):
+            records['f{}'.format(i)] = col
+        prefix = hashlib.sha1(version.encode('utf-8'))
+        keys = []
+        for j, record in enumerate(records):
+            hasher = prefix.copy()
+            hasher.update(record.tobytes())
+            for col in strCols:
+                val = col[j]
+                if not isinstance(val, bytes):
+                    val = str(val).encode('utf-8')
+                hasher.update(np.int64(len(val)).tobytes())
+                hasher.update(val)
+            keys.append(hasher.hexdigest())
+        return keys
+
+    def _batches(self, keys):
+        for start in range(0, len(keys), self.maxVariables):
+            yield keys[start:start + self.maxVariables]
+
+    def lookup(self, keys, numCols):
+        """
+        Look up results for `keys`
+
+        Parameters
+        ----------
+        keys : list of strings
+        numCols : int
+            number of result columns stored for each key
+
+        Returns
+        -------
+        found : `np.ndarray` of bools, `True` for keys in the store
+        values : `np.ndarray` of shape (len(keys), numCols), with the stored
+            values for the keys found
+        """
+        # keys may be repeated, eg. for duplicated pointings
+        positions = dict()
+        for i, key in enumerate(keys):
+            positions.setdefault(key, []).append(i)
+        found = np.zeros(len(keys), dtype=bool)
+        values = np.full((len(keys), numCols), np.nan)
+        for batch in self._batches(list(positions)):
+            query = 'SELECT key, data FROM results WHERE key IN ({})'.format(
+                ','.join('?' * len(batch)))
+            for key, data in self.conn.execute(query, batch):
+                idx = positions[key]
+                found[idx] = True
+                values[idx] = np.frombuffer(data, dtype=np.float64)
+        return found, values
+
+    def insert(self, keys, values):
+        """
+        Insert or replace the results `values` (array of shape
+        (len(keys), number of columns)) for `keys`
+        """
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        self.conn.executemany('INSERT OR REPLACE INTO results VALUES (?, ?)',
+                              ((key, sqlite3.Binary(row.tobytes()))
+                               for key, row in zip(keys, values)))
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def close(self):
+        self.conn.close()
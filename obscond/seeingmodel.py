@@ -0,0 +1,131 @@
+"""
+Vectorized seeing stage: raw seeing from `WeatherData`, scaled to the
+FWHMeff and FWHMgeom of visits through the LSST seeing model (airmass and
+wavelength scaling of the atmospheric seeing, plus the telescope, optics and
+camera contributions). The output columns are the inputs of the batch five
+sigma depth calculations, eg. `SkyCalculations.calculatePointings`.
+"""
+from __future__ import absolute_import, division, print_function
+__all__ = ['filterEffWavelens', 'fwhmEff', 'fwhmGeom', 'seeingConditions',
+           'addSeeingConditions']
+
+import numpy as np
+from lsst.sims.utils import Site
+from .coordinates import approxAltAz, airmassFromAltitude
+
+# Effective wavelengths (nm) of the LSST bands
+filterEffWavelens = dict(u=367.06, g=482.68, r=622.32, i=754.61, z=869.09,
+                         y=971.02)
+
+# Zenith FWHM (arcsec) of the telescope, optics and camera contributions
+_fwhmSysZenith = np.sqrt(0.25 ** 2 + 0.08 ** 2 + 0.30 ** 2)
+
+
+def _bandValues(bandNames, values):
+    """
+    array of `values[band]` for each band in `bandNames`, looking up each
+    distinct band once
+    """
+    bands, inverse = np.unique(np.asarray(bandNames), return_inverse=True)
+    lookup = np.array(list(values[band] for band in bands))
+    return lookup[inverse.ravel()]
+
+
+def fwhmEff(rawSeeing, airmass, bandNames):
+    """
+    FWHMeff (arcsec) of visits in bands `bandNames` at airmasses `airmass`
+    for zenith seeing at 500nm `rawSeeing` (arcsec)
+
+    Parameters
+    ----------
+    rawSeeing : array-like, arcsec
+    airmass : array-like
+    bandNames : array-like of strings
+        bands of the visits, one of 'ugrizy'
+
+    Returns
+    -------
+    FWHMeff : `np.ndarray`, arcsec
+    """
+    rawSeeing = np.asarray(rawSeeing, dtype=np.float64)
+    airmassCorrection = np.asarray(airmass, dtype=np.float64) ** 0.6
+    effWavelens = _bandValues(bandNames, filterEffWavelens)
+    fwhmSys = _fwhmSysZenith * airmassCorrection
+    fwhmAtm = rawSeeing * (500.0 / effWavelens) ** 0.3 * airmassCorrection
+    return 1.16 * np.sqrt(fwhmSys ** 2 + 1.04 * fwhmAtm ** 2)
+
+
+def fwhmGeom(FWHMeff):
+    """
+    FWHMgeom (arcsec) corresponding to `FWHMeff` (arcsec)
+    """
+    return 0.822 * np.asarray(FWHMeff) + 0.052
+
+
+def seeingConditions(mjd, bandNames, airmass, weatherData,
+                     surveyStart=59580.0):
+    """
+    raw seeing, FWHMeff and FWHMgeom of visits
+
+    Parameters
+    ----------
+    mjd : array-like
+        times of the visits in MJD
+    bandNames : array-like of strings
+        bands of the visits
+    airmass : array-like
+        airmasses of the visits
+    weatherData : `obscond.WeatherData` instance
+        seeing history
+    surveyStart : float, defaults to 59580.
+        MJD corresponding to the start of the seeing history
+
+    Returns
+    -------
+    rawSeeing : `np.ndarray`, arcsec
+    FWHMeff : `np.ndarray`, arcsec
+    FWHMgeom : `np.ndarray`, arcsec
+    """
+    mjd = np.ravel(mjd)
+    rawSeeing = weatherData.seeing(mjd - surveyStart, startDate=0.)
+    FWHMeff = fwhmEff(rawSeeing, np.ravel(airmass), np.ravel(bandNames))
+    return rawSeeing, FWHMeff, fwhmGeom(FWHMeff)
+
+
+def addSeeingConditions(pointings, weatherData, surveyStart=59580.0,
+                        site=None, raCol='fieldRA', decCol='fieldDec',
+                        mjdCol='expMJD', bandCol='filter',
+                        airmassCol='airmass'):
+    """
+    Copy of `pointings` with the columns `rawSeeing`, `FWHMeff` and
+    `FWHMgeom`, which can be passed directly to
+    `SkyCalculations.calculatePointings`. If `pointings` has no column
+    `airmassCol`, the airmass is calculated from the (approximate) altitude
+    of the positions in the columns `raCol` and `decCol` (radians), and added
+    as well.
+
+    Parameters
+    ----------
+    pointings : `pd.DataFrame`
+    weatherData : `obscond.WeatherData` instance
+    surveyStart : float, defaults to 59580.
+        MJD corresponding to the start of the seeing history
+    site : `lsst.sims.utils.Site` instance, defaults to `None`
+        site used to calculate the airmass, if `None` the LSST site
+    """
+    df = pointings.copy()
+    mjd = df[mjdCol].values
+    if airmassCol not in df.columns:
+        if site is None:
+            site = Site('LSST')
+        alt, _ = approxAltAz(np.degrees(df[raCol].values),
+                             np.degrees(df[decCol].values), mjd, site)
+        df[airmassCol] = airmassFromAltitude(alt)
+    rawSeeing, FWHMeff, FWHMgeom = seeingConditions(mjd, df[bandCol].values,
+                                                    df[airmassCol].values,
+                                                    weatherData,
+                                                    surveyStart=surveyStart)
+    df['rawSeeing'] = rawSeeing
+    df['FWHMeff'] = FWHMeff
+    df['FWHMgeom'] = FWHMgeom
+    return df
@@ -0,0 +1,247 @@
+"""
+A long running service keeping a `SkyCalculations` instance warm, so that
+clients asking for a few pointings at a time do not pay for loading the sky
+model and throughputs. Concurrent requests are coalesced into micro batches
+for `calculatePointings`. The service listens on a Unix socket or a
+localhost port, using `multiprocessing.connection`. Requests are pickled, so
+that servers on a port require clients to authenticate with a key, usually
+shared through a file readable by its owner only (see `readAuthkey`).
+"""
+from __future__ import absolute_import, division, print_function
+__all__ = ['ConditionsServer', 'ConditionsClient', 'readAuthkey']
+
+import os
+import binascii
+import time
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+import numpy as np
+import pandas as pd
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+def readAuthkey(fname, create=False):
+    """
+    Read the authentication key in the file `fname`, which must not be
+    accessible to other users. If `create` is `True` and the file does not
+    exist, a random key is generated and written to it with permissions
+    0600.
+
+    Returns
+    -------
+    authkey : bytes
+    """
+    if create and not os.path.exists(fname):
+        authkey = binascii.hexlify(os.urandom(32))
+        fd = os.open(fname, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(authkey + b'\n')
+        return authkey
+    if os.stat(fname).st_mode & 0o077:
+        raise ValueError('authkey file {} must only be accessible to its '
+                         'owner (mode 0600)\n'.format(fname))
+    with open(fname, 'rb') as f:
+        authkey = f.read().strip()
+    if not authkey:
+        raise ValueError('authkey file {} is empty\n'.format(fname))
+    return authkey
+
+
+class ConditionsServer(object):
+    """
+    Serve `calculatePointings` of `skycalc` to `ConditionsClient` instances
+
+    Parameters
+    ----------
+    skycalc : `obscond.SkyCalculations` instance
+    address : string or tuple
+        path of a Unix socket, or a ('localhost', port) tuple
+    authkey : bytes, defaults to `None`
+        key which clients must provide. Required for a port, either
+        directly or through `authkeyFile`
+    authkeyFile : string, defaults to `None`
+        file holding the key if `authkey` is `None`, generated with a random
+        key if it does not exist, see `readAuthkey`
+    backlog : int, defaults to 64
+        number of pending connections queued by the listener
+    maxBatchSize : int, defaults to 1000
+        maximum number of pointings calculated in one batch
+    maxDelay : float, unit seconds, defaults to 0.005
+        maximum time for which a request waits for other requests to join
+        its batch
+    """
+    def __init__(self, skycalc, address, authkey=None, authkeyFile=None,
+                 backlog=64, maxBatchSize=1000, maxDelay=0.005):
+        if authkey is None and authkeyFile is not None:
+            authkey = readAuthkey(authkeyFile, create=True)
+        if authkey is None and isinstance(address, tuple):
+            raise ValueError('an authkey or authkeyFile is required to '
+                             'listen on a port\n')
+        self.skycalc = skycalc
+        self.maxBatchSize = maxBatchSize
+        self.maxDelay = maxDelay
+        self.listener = Listener(address, backlog=backlog, authkey=authkey)
+        self.address = self.listener.address
+        self.requests = queue.Queue()
+        self._closed = False
+        self.numBatches = 0
+        self.numPointings = 0
+
+    def serve_forever(self):
+        """
+        Accept connections until `close` is called
+        """
+        batcher = threading.Thread(target=self._batcher)
+        batcher.daemon = True
+        batcher.start()
+        while not self._closed:
+            try:
+                conn = self.listener.accept()
+            except (OSError, IOError, EOFError, AuthenticationError):
+                if self._closed:
+                    break
+                continue
+            handler = threading.Thread(target=self._handle, args=(conn,))
+            handler.daemon = True
+            handler.start()
+
+    def close(self):
+        self._closed = True
+        self.listener.close()
+
+    def _handle(self, conn):
+        """
+        Forward requests on `conn` to the batcher and send back the results
+        """
+        try:
+            while True:
+                try:
+                    pointings, kwargs = conn.recv()
+                except EOFError:
+                    break
+                done = threading.Event()
+                reply = []
+                self.requests.put((pointings, kwargs, done, reply))
+                done.wait()
+                conn.send(reply[0])
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _kwargsKey(kwargs):
+        return repr(sorted(kwargs.items()))
+
+    def _batcher(self):
+        """
+        Collect requests into batches sharing the same keyword arguments,
+        and calculate each batch with a single call
+        """
+        pending = []
+        while True:
+            if not pending:
+                pending.append(self.requests.get())
+            deadline = time.time() + self.maxDelay
+            numRows = sum(len(request[0]) for request in pending)
+            while numRows < self.maxBatchSize:
+                timeout = deadline - time.time()
+                if timeout <= 0.:
+                    break
+                try:
+                    request = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                pending.append(request)
+                numRows += len(request[0])
+
+            key = self._kwargsKey(pending[0][1])
+            batch = list(request for request in pending
+                         if self._kwargsKey(request[1]) == key)
+            pending = list(request for request in pending
+                           if self._kwargsKey(request[1]) != key)
+            self._calculate(batch)
+
+    def _calculate(self, batch):
+        kwargs = batch[0][1]
+        lengths = list(len(request[0]) for request in batch)
+        try:
+            pointings = pd.concat(list(request[0] for request in batch))
+            df = self.skycalc.calculatePointings(pointings, **kwargs)
+            bounds = np.cumsum([0] + lengths)
+            replies = list(('ok', df.iloc[bounds[i]:bounds[i + 1]])
+                           for i in range(len(batch)))
+            self.numBatches += 1
+            self.numPointings += len(pointings)
+        except Exception as e:
+            replies = list(('error', repr(e)) for request in batch)
+        for request, reply in zip(batch, replies):
+            request[3].append(reply)
+            request[2].set()
+
+
+class ConditionsClient(object):
+    """
+    Client of a `ConditionsServer`
+
+    Parameters
+    ----------
+    address : string or tuple
+        address of the server
+    authkey : bytes, defaults to `None`
+    authkeyFile : string, defaults to `None`
+        file holding the key of the server, used if `authkey` is `None`
+    """
+    def __init__(self, address, authkey=None, authkeyFile=None):
+        if authkey is None and authkeyFile is not None:
+            authkey = readAuthkey(authkeyFile)
+        self.conn = Client(address, authkey=authkey)
+        self._lock = threading.Lock()
+
+    def calculatePointings(self, pointings, **kwargs):
+        """
+        `SkyCalculations.calculatePointings` for `pointings` on the server.
+        Angles are in radians.
+        """
+        with self._lock:
+            self.conn.send((pointings, kwargs))
+            status, result = self.conn.recv()
+        if status != 'ok':
+            raise RuntimeError('server error: {}'.format(result))
+        return result
+
+    @staticmethod
+    def _pointings(bandName, ra, dec, mjd, FWHMeff=np.nan):
+        ra, dec, mjd, bandName, FWHMeff = np.broadcast_arrays(
+            np.ravel(ra), np.ravel(dec), np.ravel(mjd), np.ravel(bandName),
+            np.ravel(FWHMeff))
+        return pd.DataFrame(dict(fieldRA=ra, fieldDec=dec, expMJD=mjd,
+                                 filter=bandName, FWHMeff=FWHMeff))
+
+    def skymag(self, bandName, ra, dec, mjd):
+        """
+        sky magnitudes in band `bandName` at positions `ra`, `dec` (radians)
+        and times `mjd`
+        """
+        df = self.calculatePointings(self._pointings(bandName, ra, dec, mjd),
+                                     calcDepths=False,
+                                     calcPointingCoords=False,
+                                     calcMoonSun=False, prefilter=False)
+        return df.filtSkyBrightness.values
+
+    def fiveSigmaDepth(self, bandName, FWHMeff, ra, dec, mjd):
+        """
+        five sigma depths in band `bandName` for seeing `FWHMeff` at
+        positions `ra`, `dec` (radians) and times `mjd`
+        """
+        df = self.calculatePointings(self._pointings(bandName, ra, dec, mjd,
+                                                     FWHMeff),
+                                     calcSkyMags=False,
+                                     calcPointingCoords=False,
+                                     calcMoonSun=False, prefilter=False)
+        return df.fiveSigmaDepth.values
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,143 @@
+"""
+Share the large arrays of a `SkyCalculations` instance (sky model template
+spectra, interpolators, throughputs) between processes through memory mapped
+files. The instance is set up once, exported to a directory, and then loaded
+by any number of worker processes, which map the large arrays instead of
+holding their own copies, so that memory does not grow with the number of
+workers. The arrays are mapped copy on write: the sky model writes to some of
+them in place, and only the pages written are copied by a process, while the
+files are never modified.
+"""
+from __future__ import absolute_import, division, print_function
+__all__ = ['exportSkyCalculations', 'loadSkyCalculations', 'isExported',
+           'exportedVersion']
+
+import os
+import pickle
+import ephem
+import numpy as np
+
+_pickleFile = 'skycalculations.pkl'
+_versionFile = 'skycalculations.version'
+
+
+class _SharedArrayPickler(pickle.Pickler):
+    """
+    Pickler writing numpy arrays larger than `minBytes` to `.npy` files in
+    `directory` rather than into the pickle. `ephem` objects, which cannot be
+    pickled, are stored through their settings.
+    """
+    def __init__(self, f, directory, minBytes):
+        pickle.Pickler.__init__(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.directory = directory
+        self.minBytes = minBytes
+        self.saved = dict()
+        # keep the arrays alive so that their ids are not reused
+        self.arrays = []
+
+    def persistent_id(self, obj):
+        if isinstance(obj, np.ndarray):
+            if obj.dtype.hasobject or obj.nbytes < self.minBytes:
+                return None
+            key = id(obj)
+            if key not in self.saved:
+                fname = 'array{}.npy'.format(len(self.saved))
+                np.save(os.path.join(self.directory, fname), obj)
+                self.saved[key] = fname
+                self.arrays.append(obj)
+            return ('ndarray', self.saved[key])
+        if isinstance(obj, ephem.Observer):
+            settings = dict((name, float(getattr(obj, name)))
+                            for name in ('lat', 'lon', 'elevation',
+                                         'pressure', 'temp', 'horizon',
+                                         'epoch', 'date'))
+            return ('ephem.Observer', settings)
+        if isinstance(obj, ephem.Body):
+            return ('ephem.Body', type(obj).__name__)
+        return None
+
+
+class _SharedArrayUnpickler(pickle.Unpickler):
+    """
+    Unpickler for `_SharedArrayPickler`, mapping the arrays copy on write
+    """
+    def __init__(self, f, directory):
+        pickle.Unpickler.__init__(self, f)
+        self.directory = directory
+        self.arrays = dict()
+
+    def persistent_load(self, pid):
+        kind, val = pid
+        if kind == 'ndarray':
+            if val not in self.arrays:
+                self.arrays[val] = np.load(os.path.join(self.directory, val),
+                                           mmap_mode='c')
+            return self.arrays[val]
+        if kind == 'ephem.Observer':
+            obs = ephem.Observer()
+            for name in ('lat', 'lon', 'elevation', 'pressure', 'temp',
+                         'horizon', 'epoch', 'date'):
+                setattr(obs, name, val[name])
+            return obs
+        if kind == 'ephem.Body':
+            return getattr(ephem, val)()
+        raise pickle.UnpicklingError('unknown persistent id {}'.format(kind))
+
+
+def exportSkyCalculations(skycalc, directory, minBytes=65536):
+    """
+    Write `skycalc` to `directory` so that it can be loaded with
+    `loadSkyCalculations` by other processes, with arrays of at least
+    `minBytes` bytes stored in `.npy` files which are memory mapped when
+    loaded. A directory on a memory backed file system (eg. `/dev/shm`)
+    avoids reading the files from disk. The `modelVersion` of `skycalc` is
+    written next to the pickle, see `exportedVersion`.
+
+    Parameters
+    ----------
+    skycalc : `obscond.SkyCalculations` instance
+    directory : string
+        directory to write to, created if it does not exist
+    minBytes : int, defaults to 65536
+        smaller arrays are stored in the pickle, and copied by each process
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    # The pickle is moved in place once complete, so that `isExported` is
+    # only `True` for complete exports
+    with open(os.path.join(directory, _versionFile), 'w') as f:
+        f.write(skycalc.modelVersion())
+    fname = os.path.join(directory, _pickleFile)
+    with open(fname + '.tmp', 'wb') as f:
+        _SharedArrayPickler(f, directory, minBytes).dump(skycalc)
+    os.rename(fname + '.tmp', fname)
+
+
+def loadSkyCalculations(directory):
+    """
+    Load a `SkyCalculations` instance written by `exportSkyCalculations`.
+    The large arrays are copy on write memory maps of the files in
+    `directory`, shared with all other processes loading the same directory
+    until a process writes to them.
+    """
+    with open(os.path.join(directory, _pickleFile), 'rb') as f:
+        return _SharedArrayUnpickler(f, directory).load()
+
+
+def isExported(directory):
+    """
+    `True` if `directory` holds an export of `exportSkyCalculations`
+    """
+    return os.path.exists(os.path.join(directory, _pickleFile))
+
+
+def exportedVersion(directory):
+    """
+    `modelVersion` of the `SkyCalculations` instance exported to
+    `directory`, or `None` if there is no export or it has no version
+    """
+    fname = os.path.join(directory, _versionFile)
+    if not isExported(directory) or not os.path.exists(fname):
+        return None
+    with open(fname, 'r') as f:
+        return f.read()
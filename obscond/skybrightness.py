@@ -1,10 +1,48 @@
 from lsst.sims.photUtils import Sed, calcM5, PhotometricParameters
 from lsst.sims.photUtils import Bandpass, BandpassDict
 import lsst.sims.skybrightness as sb
+from lsst.sims.utils import Site
+from lsst.utils import getPackageDir
+from .version import __version__
 from .atmosphere import AirmassDependentBandpass
+from .coordinates import (observableMask, approxAltAz, fastAltAz,
+                          airmassFromAltitude)
+from .skymaps import SkyMapCache
+from .batchphotometry import BatchPhotometry
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import hashlib
+import threading
+import ephem
 import numpy as np
 import pandas as pd
 
+_packageVersions = dict()
+
+
+def _packageVersion(package):
+    """
+    EUPS version of the setup package `package`, or its directory if it is
+    not setup with EUPS, or 'unknown' if it cannot be found
+    """
+    version = _packageVersions.get(package)
+    if version is not None:
+        return version
+    version = None
+    try:
+        import eups
+        version = eups.Eups().findSetupVersion(package)[0]
+    except Exception:
+        pass
+    if version is None:
+        try:
+            version = getPackageDir(package)
+        except Exception:
+            version = 'unknown'
+    _packageVersions[package] = version
+    return version
+
+
 class SkyCalculations(object):
     """
     Class for calculating sky brightnesses and related quantities, as well as
@@ -18,7 +56,49 @@ class SkyCalculations(object):
     are beyond that value, the default settings we use will return values for
     an inconsistent airmass of 2.5. This is different from the default setting
     of `sims.skybrightness` model, where this would return `np.nan`
+
+    The methods are reentrant: the state of the sky model for a calculation
+    may be passed explicitly through the `sm` parameter (see
+    `skyModelState`), and otherwise each thread other than the one creating
+    the instance uses its own sky model state, sharing the read only template
+    spectra with `self.sm`. An instance may therefore be shared by the
+    threads of a pool, see `calculatePointingsThreaded`.
+
+    The accuracy of the coordinate transformations is set by
+    `coordinateTier`:
+
+    - 'precise': the sky model uses the full transformations of
+      `lsst.sims.utils` (precession, nutation, aberration and refraction).
+      This is the reference.
+    - 'approximate': the sky model uses `approx_RaDec2AltAz`, which ignores
+      these effects. For airmasses below 2.5, positions are off by up to
+      0.3 degrees in 2022 and 0.47 degrees in 2032, mostly from precession,
+      and airmasses by up to 2 percent.
+    - 'fast': `calculatePointings` calculates the altitudes and azimuths of
+      all positions of a chunk at once with `obscond.fastAltAz`, which
+      includes precession but ignores nutation, aberration and refraction,
+      and passes them to the sky model with `setRaDecAltAzMjd`, which skips
+      its own transformation of each pointing. For airmasses below 2.5,
+      positions are within 0.04 degrees and airmasses within 0.15 percent
+      of 'precise'. The airmass, altitude and azimuth returned, the depths
+      and the prefilter all use these coordinates. The other methods use
+      the 'approximate' transformations.
+
+    The bounds on the coordinates were measured against astropy. The sky
+    magnitudes and depths mostly depend on the coordinates through the
+    airmass, and are expected within 0.01 mag ('fast') and 0.05 mag
+    ('approximate') of 'precise'; `test_skybrightness` checks these bounds on
+    the example pointings. Transforming the coordinates costs about 0.5
+    microseconds per pointing with `fastAltAz`, against about 200
+    microseconds with astropy. `scripts/benchmark_coordinates.py` measures
+    the errors and speed of the tiers with the sky model.
     """
+    coordinateTiers = ('precise', 'approximate', 'fast')
+    # keyword arguments shared by `calculatePointings` and
+    # `calculatePointingsFromCache`
+    _cacheOptions = ('raCol', 'decCol', 'bandCol', 'mjdCol', 'FWHMeffCol',
+                     'calcDepths')
+
     def __init__(self,
                  observatory='LSST',
                  hwBandpassDict=None,
@@ -26,7 +106,9 @@ class SkyCalculations(object):
                  photparams=None,
                  airmass_limit=4.0,
                  mags=False,
-                 preciseAltAz=True
+                 preciseAltAz=True,
+                 skyMapCache=None,
+                 coordinateTier=None
                  ):
         """
         Parameters
@@ -38,61 +120,180 @@ class SkyCalculations(object):
         photparams :
         pointings :
         airmass_limit :
+        skyMapCache : `obscond.SkyMapCache` instance, defaults to `None`
+            cache of sky magnitude maps used by `calculatePointingsFromCache`
+        coordinateTier : {'precise', 'approximate', 'fast'}, defaults to `None`
+            accuracy of the coordinate transformations. If `None`,
+            'precise' if `preciseAltAz` is `True` and 'approximate'
+            otherwise. Overrides `preciseAltAz` if given.
         """
+        if coordinateTier is None:
+            coordinateTier = 'precise' if preciseAltAz else 'approximate'
+        if coordinateTier not in self.coordinateTiers:
+            raise ValueError('coordinateTier must be one of {}\n'.format(
+                self.coordinateTiers))
+        preciseAltAz = coordinateTier == 'precise'
+        self.coordinateTier = coordinateTier
         self.sm = sb.SkyModel(observatory=observatory,
                               mags=mags,
                               preciseAltAz=preciseAltAz,
                               airmass_limit=airmass_limit)
+        self.site = Site(observatory)
+        self.observatory = observatory
+        self.airmass_limit = airmass_limit
+        self.preciseAltAz = preciseAltAz
         self.adb = AirmassDependentBandpass(hwBandpassDict) 
     
         self.photparams = photparams
         if self.photparams == 'LSST':
             self.photparams = PhotometricParameters()
+        self.skyMapCache = skyMapCache
+        self._flatSkyPhotometry = None
+        self._ownerThread = threading.current_thread().ident
+        self._local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._ownerThread = threading.current_thread().ident
+        self._local = threading.local()
+
+    def skyModelState(self):
+        """
+        Return a new sky model for the per call state of calculations, which
+        can be passed as the `sm` parameter of the methods. It shares the read
+        only template spectra and interpolators of `self.sm`, but has its own
+        coordinates, spectra and ephemeris objects.
+        """
+        sm = copy.copy(self.sm)
+        for name, val in vars(self.sm).items():
+            if isinstance(val, (ephem.Observer, ephem.Body)):
+                setattr(sm, name, val.copy())
+            elif isinstance(val, np.ndarray):
+                setattr(sm, name, val.copy())
+        return sm
+
+    def _skyModel(self):
+        """
+        sky model used when none is passed explicitly: `self.sm` in the thread
+        which created the instance, and a thread local `skyModelState` in any
+        other thread
+        """
+        if threading.current_thread().ident == self._ownerThread:
+            return self.sm
+        sm = getattr(self._local, 'sm', None)
+        if sm is None:
+            sm = self.skyModelState()
+            self._local.sm = sm
+        return sm
 
     def skymag(self, bandName, ra=None, dec=None, mjd=None,
                hwBandPassDict=None,
-               sm=None):
+               sm=None, posIndex=0):
         """
         ra : radians
         dec : radians
+        posIndex : index of the position, if the sky model has been set to
+            several positions
         """
         if hwBandPassDict is None:
             hwBandPassDict = self.adb.hwbandpassDict
         if sm is None:
-            sm = self.sm
+            sm = self._skyModel()
         if ra is not None:
             sm.setRaDecMjd(lon=ra, lat=dec,
                            filterNames=bandName, mjd=mjd,
                            degrees=False, azAlt=False)
-        skymag = sm.returnMags(bandpasses=hwBandPassDict)[bandName][0]
+        skymag = sm.returnMags(bandpasses=hwBandPassDict)[bandName][posIndex]
         return skymag
 
 
     def fiveSigmaDepth(self, bandName, FWHMeff, ra=None, dec=None,
                        mjd=None, sm=None, provided_airmass=None,
-                       use_provided_airmass=True):
+                       use_provided_airmass=True, posIndex=0):
         """
+        posIndex : index of the position, if the sky model has been set to
+            several positions
         """
         if sm is None:
-            sm = self.sm
+            sm = self._skyModel()
         if ra is not None:
             sm.setRaDecMjd(lon=ra, lat=dec,
                            filterNames=bandName, mjd=mjd,
                            degrees=False, azAlt=False)
-        airmass = sm.airmass
+        airmass = np.ravel(sm.airmass)[posIndex]
         # SED 
         wave, spec = sm.returnWaveSpec()
-        sed = Sed(wavelen=wave, flambda=spec[0])
-        amass = airmass
         if use_provided_airmass and provided_airmass is not None:
             amass = provided_airmass
         else:
             amass = airmass
-        bp = self.adb.bandpassForAirmass(bandName, amass) 
+        return self._fiveSigmaDepthFromSpec(bandName, FWHMeff, wave,
+                                            spec[posIndex], amass)
+
+    def _fiveSigmaDepthFromSpec(self, bandName, FWHMeff, wave, flambda,
+                                airmass):
+        """
+        five sigma depth for a sky spectrum `flambda` on wavelengths `wave`
+        """
+        sed = Sed(wavelen=wave, flambda=flambda)
+        bp = self.adb.bandpassForAirmass(bandName, airmass) 
         fieldmags = calcM5(sed, bp, self.adb.hwbandpassDict[bandName], self.photparams,
                            FWHMeff)
         return fieldmags
 
+    def observableMask(self, ra, dec, mjd, airmass_limit=None,
+                       maxSunAlt=0.):
+        """
+        Cheap vectorized estimate of which pointings can be described by the
+        sky model: ie. pointings with airmass below `airmass_limit` taken when
+        the sun altitude is below `maxSunAlt`. Uses approximate coordinate
+        transformations, so that pointings within a few arcminutes of the
+        limits may be misclassified.
+
+        Parameters
+        ----------
+        ra : array-like, radians
+        dec : array-like, radians
+        mjd : array-like
+        airmass_limit : float, defaults to `None`
+            if `None`, the `airmass_limit` of the instance is used
+        maxSunAlt : float, degrees, defaults to 0.
+            if `None`, no cut on the sun altitude is applied
+
+        Returns
+        -------
+        mask : `np.ndarray` of bools, `True` for pointings to be calculated
+        """
+        if airmass_limit is None:
+            airmass_limit = self.airmass_limit
+        return observableMask(ra, dec, mjd, site=self.site,
+                              airmassLimit=airmass_limit,
+                              maxSunAlt=maxSunAlt,
+                              fast=self.coordinateTier == 'fast')
+
+    def _altAz(self, ra, dec, mjd):
+        """
+        bulk approximate altitudes and azimuths in degrees for `ra`, `dec`
+        in degrees, with the transformation of the coordinate tier
+        """
+        if self.coordinateTier == 'fast':
+            return fastAltAz(ra, dec, mjd, self.site)
+        return approxAltAz(ra, dec, mjd, self.site)
+
+    @staticmethod
+    def _positionColName(prefix, name):
+        """
+        name of the result column `name` for the position `prefix`
+        """
+        if prefix == '':
+            return name
+        return prefix + name[0].upper() + name[1:]
+
     def calculatePointings(self, pointings,
                            raCol='fieldRA', 
                            decCol='fieldDec',
@@ -104,104 +305,521 @@ class SkyCalculations(object):
                            calcPointingCoords=True,
                            calcMoonSun=True,
                            hwBandPassDict=None,
-                           sm=None):
+                           sm=None,
+                           prefilter=True,
+                           maxSunAlt=0.,
+                           fillValue=np.nan,
+                           extraCoordCols=None,
+                           passThroughCols=None,
+                           resultStore=None,
+                           compact=False,
+                           batchPhotometry=None):
         """
+        Calculate sky brightness, five sigma depths and coordinates for a
+        set of pointings.
+
+        Parameters
+        ----------
+        pointings : `pd.DataFrame`
+            pointings indexed by obsHistID, with angles in radians
+        prefilter : Bool, defaults to `True`
+            if `True`, pointings beyond the airmass limit of the instance or
+            with the sun above `maxSunAlt` are identified using approximate
+            coordinates, and are not sent to the sky model. All results for
+            such pointings are set to `fillValue`
+        maxSunAlt : float, degrees, defaults to 0.
+            sun altitude used in the prefilter
+        fillValue : float, defaults to `np.nan`
+            value of the results for pointings removed by the prefilter
+        extraCoordCols : dict, defaults to `None`
+            dictionary with keys given by a prefix, and values given by a
+            tuple of the (RA, Dec) column names of additional positions for
+            each pointing, eg. `dict(dithered=('ditheredRA', 'ditheredDec'))`.
+            All positions of a pointing are evaluated in a single call to the
+            sky model, and the position dependent results (coordinates, sky
+            brightness and depths) for the additional positions are returned
+            in columns named by the prefix, eg. `ditheredFiveSigmaDepth`.
+        passThroughCols : sequence of strings, defaults to `None`
+            columns of `pointings` copied to the results, eg. `night` and
+            `filter` for partitioning the output
+        resultStore : `obscond.PointingResultStore`, defaults to `None`
+            if provided, results of pointings whose inputs, options and
+            models match rows of the store are read from it, and only the
+            other pointings are calculated and added to the store
+        compact : Bool, defaults to `False`
+            if `True`, results are float32 rather than float64. The index
+            of obsHistIDs is always int64.
+        batchPhotometry : `obscond.BatchPhotometry`, defaults to `None`
+            if provided, the sky spectra of the pointings are collected in
+            batches of `batchPhotometry.batchSize` pointings, and the sky
+            brightness (in the hardware bandpasses of `batchPhotometry`)
+            and depths are calculated for each batch, in the precision of
+            `batchPhotometry`, rather than pointing by pointing. See
+            `validateBatchPhotometry` for the accuracy.
         """
+        if resultStore is not None:
+            return self._calculatePointingsWithStore(pointings, resultStore,
+                                                     passThroughCols,
+                                                     raCol=raCol,
+                                                     decCol=decCol,
+                                                     bandCol=bandCol,
+                                                     mjdCol=mjdCol,
+                                                     FWHMeffCol=FWHMeffCol,
+                                                     calcSkyMags=calcSkyMags,
+                                                     calcDepths=calcDepths,
+                                                     calcPointingCoords=calcPointingCoords,
+                                                     calcMoonSun=calcMoonSun,
+                                                     hwBandPassDict=hwBandPassDict,
+                                                     sm=sm,
+                                                     prefilter=prefilter,
+                                                     maxSunAlt=maxSunAlt,
+                                                     fillValue=fillValue,
+                                                     extraCoordCols=extraCoordCols,
+                                                     compact=compact,
+                                                     batchPhotometry=batchPhotometry)
+
+        positions = [('', raCol, decCol)]
+        if extraCoordCols is not None:
+            positions += list((prefix, extraCoordCols[prefix][0],
+                               extraCoordCols[prefix][1])
+                              for prefix in sorted(extraCoordCols))
+        numPos = len(positions)
+
+        positionCols = []
+        if calcPointingCoords:
+            positionCols += ['airmass', 'altitude' , 'azimuth']
+        if calcDepths:
+            positionCols += ['fiveSigmaDepth']
+        if calcSkyMags:
+            positionCols += ['filtSkyBrightness']
+        # result columns and the corresponding keys of `getComputedVals`
+        timeKeys = []
+        if calcMoonSun:
+            timeKeys += [('moonRA', 'moonRA'), ('moonDec', 'moonDec'),
+                         ('moonAlt', 'moonAlt'), ('moonAZ', 'moonAz'),
+                         ('moonPhase', 'moonPhase'), ('sunAlt', 'sunAlt'),
+                         ('sunAz', 'sunAz')]
+        timeCols = list(col for col, key in timeKeys)
+
         resultCols = []
+        for k, pos in enumerate(positions):
+            for col in positionCols:
+                resultCols.append(self._positionColName(pos[0], col))
+                # time dependent quantities follow the nominal coordinates
+                if k == 0 and col == 'azimuth':
+                    resultCols += timeCols
+        if not calcPointingCoords:
+            resultCols = timeCols + resultCols
 
         if hwBandPassDict is None:
             hwBandPassDict = self.adb.hwbandpassDict
         if sm is None:
-            sm = self.sm
+            sm = self._skyModel()
 
+        # All results are written directly into the rows of a single buffer,
+        # which backs the returned dataframe without further copies
         num = len(pointings)
-        idxs = np.zeros(num)
-        skymags = np.zeros(num)
-        fiveSigmaDepth = np.zeros(num)
-        airmass = np.zeros(num)
-        altitude = np.zeros(num)
-        azimuth = np.zeros(num)
-        moonRA = np.zeros(num)
-        moonDec = np.zeros(num)
-        moonAlt = np.zeros(num)
-        moonAZ = np.zeros(num)
-        moonPhase = np.zeros(num)
-        sunAlt = np.zeros(num)
-        sunAz = np.zeros(num)
-
-
-        count = 0 
-        for obsHistID, row in pointings.iterrows():
-            ra  =row[raCol]
-            dec  =row[decCol]
-            mjd = row[mjdCol]
-            bandName = row[bandCol]
-            sm.setRaDecMjd(lon=ra, lat=dec,
-                           filterNames=bandName, mjd=mjd,
-                           degrees=False, azAlt=False)
+        idxs = pointings.index.values.astype(np.int64)
+        dtype = np.float32 if compact else np.float64
+        buf = np.full((len(resultCols), num), fillValue, dtype=dtype)
+        row = dict((name, i) for i, name in enumerate(resultCols))
+        posRows = dict((col, np.array(list(row[self._positionColName(pos[0],
+                                                                     col)]
+                                           for pos in positions)))
+                       for col in positionCols)
+
+        ras = np.array(list(pointings[pos[1]].values for pos in positions))
+        decs = np.array(list(pointings[pos[2]].values for pos in positions))
+        mjds = pointings[mjdCol].values
+        bandNames = pointings[bandCol].values
+        FWHMeffs = None
+        if calcDepths:
+            FWHMeffs = pointings[FWHMeffCol].values
+
+        if prefilter:
+            valid = np.array(list(self.observableMask(ras[k], decs[k], mjds,
+                                                      maxSunAlt=maxSunAlt)
+                                  for k in range(numPos)))
+        else:
+            valid = np.ones((numPos, num), dtype=bool)
+
+        # altitudes and azimuths of all positions at once, passed to the sky
+        # model instead of being transformed pointing by pointing
+        bulkAltAz = self.coordinateTier == 'fast'
+        if bulkAltAz:
+            alts = np.zeros((numPos, num))
+            azs = np.zeros((numPos, num))
+            for k in range(numPos):
+                alt, az = fastAltAz(np.degrees(ras[k]), np.degrees(decs[k]),
+                                    mjds, self.site)
+                alts[k] = np.radians(alt)
+                azs[k] = np.radians(az)
+
+        calcRows = np.flatnonzero(valid.any(axis=0))
+        batch = batchPhotometry is not None and (calcDepths or calcSkyMags)
+        if batch:
+            # spectra and airmasses of all positions of up to `batchSize`
+            # calculated rows, passed to `batchPhotometry` when full
+            batchSize = batchPhotometry.batchSize
+            specs = None
+            batchRows = np.zeros(batchSize, dtype=np.int64)
+            batchAirmass = np.zeros((numPos, batchSize))
+            numBatched = 0
+
+        for count in calcRows:
+            bandName = bandNames[count]
+            if bulkAltAz:
+                sm.setRaDecAltAzMjd(ra=ras[:, count], dec=decs[:, count],
+                                    alt=alts[:, count], az=azs[:, count],
+                                    mjd=mjds[count], degrees=False,
+                                    filterNames=bandName)
+            else:
+                sm.setRaDecMjd(lon=ras[:, count], lat=decs[:, count],
+                               filterNames=bandName, mjd=mjds[count],
+                               degrees=False, azAlt=False)
             mydict = sm.getComputedVals()
             if calcPointingCoords:
-                if count == 0:
-                    resultCols += ['airmass', 'altitude' , 'azimuth']
-                airmass[count] = mydict['airmass'][0]
-                altitude[count] = mydict['alts'][0]
-                azimuth[count] = mydict['azs'][0]
-
-            if calcMoonSun:
-                if count == 0:
-                    resultCols += ['moonRA', 'moonDec' , 'moonAlt', 'moonAZ', 'moonPhase']
-                    resultCols += ['sunAlt', 'sunAz']
-                moonRA[count] = mydict['moonRA']
-                moonDec[count] = mydict['moonDec']
-                moonAlt[count] = mydict['moonAlt']
-                moonAZ[count] = mydict['moonAz']
-                moonPhase[count] = mydict['moonPhase']
-                sunAlt[count] = mydict['sunAlt']
-                sunAz[count] = mydict['sunAz']
+                buf[posRows['airmass'], count] = mydict['airmass']
+                buf[posRows['altitude'], count] = mydict['alts']
+                buf[posRows['azimuth'], count] = mydict['azs']
+
+            for col, key in timeKeys:
+                buf[row[col], count] = mydict[key]
+
+            if batch:
+                wave, spec = sm.returnWaveSpec()
+                if specs is None:
+                    specs = np.zeros((numPos, batchSize, len(wave)),
+                                     dtype=batchPhotometry.dtype)
+                specs[:, numBatched] = spec
+                batchAirmass[:, numBatched] = np.ravel(mydict['airmass'])
+                batchRows[numBatched] = count
+                numBatched += 1
+                if numBatched == batchSize:
+                    self._batchPhotometryResults(batchPhotometry, buf,
+                                                 posRows, batchRows,
+                                                 bandNames, FWHMeffs,
+                                                 batchAirmass, wave, specs,
+                                                 calcDepths, calcSkyMags)
+                    numBatched = 0
+                continue
 
             if calcDepths:
-                bandName = row[bandCol]
-                FWHMeff = row[FWHMeffCol]
-                if count == 0:
-                    resultCols += ['fiveSigmaDepth']
-                fiveSigmaDepth[count] = self.fiveSigmaDepth(bandName,
-                                                            FWHMeff, sm=sm,
-                                                            provided_airmass=airmass[count],
-                                                            use_provided_airmass=False)
+                wave, spec = sm.returnWaveSpec()
+                airmasses = np.ravel(mydict['airmass'])
+                for k in range(numPos):
+                    buf[posRows['fiveSigmaDepth'][k], count] = \
+                        self._fiveSigmaDepthFromSpec(bandName,
+                                                     FWHMeffs[count],
+                                                     wave, spec[k],
+                                                     airmasses[k])
             if calcSkyMags:
-                bandName = row[bandCol]
-                if count == 0:
-                    resultCols += ['filtSkyBrightness']
-                skymags[count] = self.skymag(bandName, sm=sm,
-                                             hwBandPassDict=hwBandPassDict)
+                mags = sm.returnMags(bandpasses=hwBandPassDict)[bandName]
+                buf[posRows['filtSkyBrightness'], count] = mags
+
+        if batch and numBatched > 0:
+            self._batchPhotometryResults(batchPhotometry, buf, posRows,
+                                         batchRows[:numBatched], bandNames,
+                                         FWHMeffs,
+                                         batchAirmass[:, :numBatched], wave,
+                                         specs[:, :numBatched], calcDepths,
+                                         calcSkyMags)
+
+        for k in range(numPos):
+            for col in positionCols:
+                buf[posRows[col][k], ~valid[k]] = fillValue
+
+        df = pd.DataFrame(buf.T, columns=resultCols, copy=False,
+                          index=pd.Index(idxs, name='obsHistID'))
+        if passThroughCols is not None:
+            for col in passThroughCols:
+                df[col] = pointings[col].values
+        return df
+
+    @staticmethod
+    def _batchPhotometryResults(batchPhotometry, buf, posRows, rows,
+                                bandNames, FWHMeffs, airmass, wave, specs,
+                                calcDepths, calcSkyMags):
+        """
+        write the sky brightness and depths of the sky spectra `specs` (of
+        shape (number of positions, len(rows), number of wavelengths)) of
+        the pointings `rows`, calculated with `batchPhotometry`, to the
+        result buffer `buf`
+        """
+        rowBands = bandNames[rows]
+        for k in range(len(specs)):
+            counts = batchPhotometry.skyCounts(rowBands, wave, specs[k])
+            if calcDepths:
+                depths = batchPhotometry.fiveSigmaDepths(rowBands,
+                                                         FWHMeffs[rows],
+                                                         airmass[k], wave,
+                                                         specs[k],
+                                                         counts=counts)
+                buf[posRows['fiveSigmaDepth'][k], rows] = depths
+            if calcSkyMags:
+                skymags = batchPhotometry.skymagsFromCounts(rowBands, counts)
+                buf[posRows['filtSkyBrightness'][k], rows] = skymags
+
+    def calculatePointingsThreaded(self, pointings, numThreads=None,
+                                   chunksize=1000, **kwargs):
+        """
+        `calculatePointings` on chunks of `pointings` of size `chunksize` in
+        a pool of `numThreads` threads sharing this instance. Each thread
+        uses its own sky model state. Keyword arguments are passed to
+        `calculatePointings`, except for `sm` and `resultStore` which are
+        not supported.
+        """
+        if kwargs.get('sm') is not None:
+            raise ValueError('each thread uses its own sky model state\n')
+        if kwargs.get('resultStore') is not None:
+            raise ValueError('resultStore cannot be shared by threads\n')
+        chunks = list(pointings.iloc[start:start + chunksize]
+                      for start in range(0, len(pointings), chunksize))
+        if len(chunks) < 2:
+            return self.calculatePointings(pointings, **kwargs)
+        with ThreadPoolExecutor(max_workers=numThreads) as pool:
+            dfs = list(pool.map(lambda chunk:
+                                self.calculatePointings(chunk, **kwargs),
+                                chunks))
+        return pd.concat(dfs)
+
+    def modelVersion(self, hwBandPassDict=None):
+        """
+        String identifying the models used in the calculations: the versions
+        of `obscond`, `sims_skybrightness` and `sims_skybrightness_data`, the
+        sky model settings, a hash of the hardware throughputs and the
+        photometric parameters.
+        """
+        if hwBandPassDict is None:
+            hwBandPassDict = self.adb.hwbandpassDict
+        hasher = hashlib.sha1()
+        for band in sorted(hwBandPassDict.keys()):
+            bp = hwBandPassDict[band]
+            hasher.update(band.encode('utf-8'))
+            hasher.update(np.ascontiguousarray(bp.wavelen).tobytes())
+            hasher.update(np.ascontiguousarray(bp.sb).tobytes())
+        photparams = ''
+        if self.photparams is not None:
+            photparams = repr(sorted(vars(self.photparams).items()))
+        return '|'.join([__version__,
+                         _packageVersion('sims_skybrightness'),
+                         _packageVersion('sims_skybrightness_data'),
+                         self.observatory,
+                         repr(self.airmass_limit),
+                         repr(self.preciseAltAz),
+                         self.coordinateTier,
+                         hasher.hexdigest(),
+                         photparams])
+
+    def _calculatePointingsWithStore(self, pointings, resultStore,
+                                     passThroughCols, **kwargs):
+        """
+        `calculatePointings` with results read from and added to the
+        `obscond.PointingResultStore` `resultStore`
+        """
+        extraCoordCols = kwargs['extraCoordCols']
+        if extraCoordCols is None:
+            extraCoordCols = dict()
+        options = sorted((key, val) for key, val in kwargs.items()
+                         if key not in ('sm', 'hwBandPassDict',
+                                        'extraCoordCols'))
+        options.append(('extraCoordCols', sorted(extraCoordCols.items())))
+        version = self.modelVersion(kwargs['hwBandPassDict']) + repr(options)
+
+        inputCols = [kwargs['raCol'], kwargs['decCol'], kwargs['mjdCol'],
+                     kwargs['bandCol']]
+        if kwargs['calcDepths']:
+            inputCols.append(kwargs['FWHMeffCol'])
+        for prefix in sorted(extraCoordCols):
+            inputCols += list(extraCoordCols[prefix])
+        keys = resultStore.pointingKeys(list(pointings[col].values
+                                             for col in inputCols),
+                                        version)
+
+        # The columns of the results do not depend on the pointings
+        columns = self.calculatePointings(pointings.iloc[:0], **kwargs).columns
+        found, values = resultStore.lookup(keys, len(columns))
+        missing = np.flatnonzero(~found)
+        if len(missing) > 0:
+            computed = self.calculatePointings(pointings.iloc[missing],
+                                               **kwargs)
+            values[missing] = computed.values
+            resultStore.insert(list(keys[i] for i in missing),
+                               computed.values)
+
+        if kwargs['compact']:
+            values = values.astype(np.float32)
+        idxs = pointings.index.values.astype(np.int64)
+        df = pd.DataFrame(values, columns=columns, copy=False,
+                          index=pd.Index(idxs, name='obsHistID'))
+        if passThroughCols is not None:
+            for col in passThroughCols:
+                df[col] = pointings[col].values
+        return df
+
+    def buildSkyMapCache(self, cacheDir, mjdStart, mjdEnd, nside=32,
+                         dt=10. / 60. / 24., bands='ugrizy', maxSunAlt=-12.):
+        """
+        Calculate sky magnitude HEALPix maps on a regular time grid with the
+        sky model of the instance, store them in memory mapped files in
+        `cacheDir` and use them in `calculatePointingsFromCache`. See
+        `obscond.SkyMapCache.build` for the parameters.
+        """
+        self.skyMapCache = SkyMapCache.build(cacheDir, self._skyModel(),
+                                             self.adb.hwbandpassDict,
+                                             mjdStart=mjdStart,
+                                             mjdEnd=mjdEnd,
+                                             nside=nside, dt=dt, bands=bands,
+                                             maxSunAlt=maxSunAlt,
+                                             site=self.site)
+        return self.skyMapCache
+
+    def fiveSigmaDepthFlatSky(self, bandName, skymag, FWHMeff, airmass):
+        """
+        five sigma depth for a sky with a flat SED normalized to the sky
+        magnitude `skymag` in the hardware bandpass `bandName`. This ignores
+        the variation of the shape of the sky spectrum across the band.
+        See `fiveSigmaDepthsFlatSky` for arrays of pointings.
+        """
+        hwbp = self.adb.hwbandpassDict[bandName]
+        sed = Sed()
+        sed.setFlatSED()
+        sed.multiplyFluxNorm(sed.calcFluxNorm(skymag, hwbp))
+        bp = self.adb.bandpassForAirmass(bandName, airmass)
+        return calcM5(sed, bp, hwbp, self.photparams, FWHMeff)
+
+    def fiveSigmaDepthsFlatSky(self, bandNames, skymags, FWHMeff, airmass):
+        """
+        `fiveSigmaDepthFlatSky` for arrays of pointings, with the counts of
+        the flat skies and the depths calculated for all pointings at once
+        by a float64 `obscond.BatchPhotometry`
+        """
+        if self._flatSkyPhotometry is None:
+            self._flatSkyPhotometry = self.batchPhotometry(precision='float64')
+        photometry = self._flatSkyPhotometry
+        bandNames = np.ravel(bandNames)
+        counts = photometry.countsFromSkymags(bandNames, skymags)
+        return photometry.fiveSigmaDepths(bandNames, FWHMeff, airmass,
+                                          None, None, counts=counts)
+
+    def calculatePointingsFromCache(self, pointings,
+                                    raCol='fieldRA',
+                                    decCol='fieldDec',
+                                    bandCol='filter',
+                                    mjdCol='expMJD',
+                                    FWHMeffCol='FWHMeff',
+                                    calcDepths=True):
+        """
+        Approximate sky brightness, airmass and five sigma depths for a set
+        of pointings, with the sky brightness interpolated from the sky
+        magnitude maps in `self.skyMapCache` rather than calculated with the
+        sky model. The airmass is calculated with approximate coordinates,
+        and the depths use `fiveSigmaDepthsFlatSky`. Pointings outside the
+        cache, or close to masked regions of the maps have results set to
+        `np.nan`.
+
+        Parameters
+        ----------
+        pointings : `pd.DataFrame`
+            pointings indexed by obsHistID, with angles in radians
+        """
+        if self.skyMapCache is None:
+            raise ValueError('skyMapCache must be set, or built with '
+                             'buildSkyMapCache\n')
+        ras = pointings[raCol].values
+        decs = pointings[decCol].values
+        mjds = pointings[mjdCol].values
+        bandNames = pointings[bandCol].values
 
-            idxs[count] = obsHistID
-            count += 1
+        alt, _ = self._altAz(np.degrees(ras), np.degrees(decs), mjds)
+        airmass = airmassFromAltitude(alt)
+        skymags = self.skyMapCache.skymags(bandNames, ras, decs, mjds)
+        results = dict(airmass=airmass, filtSkyBrightness=skymags)
+        resultCols = ['airmass', 'filtSkyBrightness']
 
         if calcDepths:
-            df = pd.DataFrame(dict(obsHistID=idxs, filtSkyBrightness=skymags,
-                                   fiveSigmaDepth=fiveSigmaDepth,
-                                   altitude=altitude,
-                                   azimuth=azimuth,
-                                   airmass=airmass,
-                                   moonRA=moonRA,
-                                   moonDec=moonDec,
-                                   moonAZ=moonAZ,
-                                   moonAlt=moonAlt,
-                                   moonPhase=moonPhase,
-                                   sunAlt=sunAlt,
-                                   sunAz=sunAz)).set_index('obsHistID')
-        else:
-            df = pd.DataFrame(dict(obsHistID=idxs, filtSkyBrightness=skymags,
-                                   altitude=altitude,
-                                   azimuth=azimuth,
-                                   airmass=airmass,
-                                   moonRA=moonRA,
-                                   moonDec=moonDec,
-                                   moonAZ=moonAZ,
-                                   moonAlt=moonAlt,
-                                   moonPhase=moonPhase,
-                                   sunAlt=sunAlt,
-                                   sunAz=sunAz)).set_index('obsHistID')
-        df.index = df.index.astype(np.int64)
+            FWHMeffs = pointings[FWHMeffCol].values
+            fiveSigmaDepth = np.full(len(pointings), np.nan)
+            sel = np.flatnonzero(np.isfinite(skymags) &
+                                 (airmass <= self.airmass_limit))
+            fiveSigmaDepth[sel] = self.fiveSigmaDepthsFlatSky(bandNames[sel],
+                                                              skymags[sel],
+                                                              FWHMeffs[sel],
+                                                              airmass[sel])
+            results['fiveSigmaDepth'] = fiveSigmaDepth
+            resultCols += ['fiveSigmaDepth']
+
+        idxs = pointings.index.values.astype(np.int64)
+        df = pd.DataFrame(results, index=pd.Index(idxs, name='obsHistID'))
         return df[resultCols]
+
+    def validateSkyMapCache(self, pointings, **kwargs):
+        """
+        Compare the results of `calculatePointingsFromCache` to the exact
+        results of `calculatePointings` for `pointings`. Keyword arguments
+        are passed to `calculatePointings`, and those of
+        `calculatePointingsFromCache` (the column names and `calcDepths`)
+        are passed to it as well.
+
+        Returns
+        -------
+        `pd.DataFrame` with the exact and cached sky brightness and depths,
+        and their differences (cached - exact) in columns `dSkyBrightness`
+        and `dFiveSigmaDepth`, for the quantities calculated by both methods.
+        `df.describe()` summarizes the accuracy of the cache.
+        """
+        cacheKwargs = dict((key, val) for key, val in kwargs.items()
+                           if key in self._cacheOptions)
+        exact = self.calculatePointings(pointings,
+                                        calcPointingCoords=False,
+                                        calcMoonSun=False, **kwargs)
+        cached = self.calculatePointingsFromCache(pointings, **cacheKwargs)
+        diffCols = [('filtSkyBrightness', 'dSkyBrightness'),
+                    ('fiveSigmaDepth', 'dFiveSigmaDepth')]
+        diffCols = list((col, dcol) for col, dcol in diffCols
+                        if col in exact.columns and col in cached.columns)
+        df = exact.join(cached[list(col for col, _ in diffCols)],
+                        rsuffix='Cached')
+        for col, dcol in diffCols:
+            df[dcol] = df[col + 'Cached'] - df[col]
+        return df
+
+    def batchPhotometry(self, precision='float32', wavelengthStep=1,
+                        batchSize=1024):
+        """
+        `obscond.BatchPhotometry` with the bandpasses and photometric
+        parameters of the instance, to be passed to `calculatePointings`
+        """
+        return BatchPhotometry(self.adb, photparams=self.photparams,
+                               precision=precision,
+                               wavelengthStep=wavelengthStep,
+                               batchSize=batchSize)
+
+    def validateBatchPhotometry(self, pointings, batchPhotometry=None,
+                                **kwargs):
+        """
+        Compare the sky brightness and depths of `calculatePointings` with
+        `batchPhotometry` to those calculated pointing by pointing, for
+        `pointings`. Keyword arguments are passed to `calculatePointings`.
+
+        Returns
+        -------
+        `pd.DataFrame` with the exact and batch sky brightness and depths,
+        and their differences (batch - exact) in columns `dSkyBrightness`
+        and `dFiveSigmaDepth`. `df.groupby(bandCol).describe()` gives the
+        error budget of the batch photometry in each band.
+        """
+        if batchPhotometry is None:
+            batchPhotometry = self.batchPhotometry()
+        kwargs = dict(kwargs, calcPointingCoords=False, calcMoonSun=False)
+        exact = self.calculatePointings(pointings, **kwargs)
+        batch = self.calculatePointings(pointings,
+                                        batchPhotometry=batchPhotometry,
+                                        **kwargs)
+        df = exact.join(batch[['filtSkyBrightness', 'fiveSigmaDepth']],
+                        rsuffix='Batch')
+        df['dSkyBrightness'] = df.filtSkyBrightnessBatch - df.filtSkyBrightness
+        df['dFiveSigmaDepth'] = df.fiveSigmaDepthBatch - df.fiveSigmaDepth
+        df[kwargs.get('bandCol', 'filter')] = \
+            pointings[kwargs.get('bandCol', 'filter')].values
+        return df
@@ -0,0 +1,206 @@
+"""
+Cache of sky magnitude HEALPix maps on a regular grid of times, stored in
+memory mapped files, so that sky brightnesses for large numbers of pointings
+can be interpolated rather than calculated with the sky model.
+"""
+from __future__ import absolute_import, division, print_function
+__all__ = ['SkyMapCache']
+
+import os
+import json
+import numpy as np
+import healpy as hp
+from .coordinates import approxSunRaDec, approxAltAz
+
+
+class SkyMapCache(object):
+    """
+    Sky magnitudes in a set of bands, on HEALPix maps of resolution `nside`
+    evaluated at times on a regular grid `mjdStart + i * dt`. The maps are
+    stored in memory mapped files in `cacheDir`, one file per band with shape
+    (number of times, number of pixels).
+
+    The accuracy of the interpolated sky magnitudes is controlled by `nside`
+    and `dt`: the pixel size is about 58.6 / nside degrees, and the storage
+    is 4 * 12 * nside**2 bytes per band for each time in the grid. Grid times
+    at which the sun is above `maxSunAlt` are not calculated, and hold
+    `np.nan`.
+
+    Parameters
+    ----------
+    cacheDir : string
+        directory holding the memory mapped maps
+    mjdStart : float
+        first time of the grid in MJD
+    numTimes : int
+        number of times in the grid
+    nside : int
+        HEALPix nside of the maps
+    dt : float, unit days
+        spacing of the time grid
+    bands : string or sequence of strings
+        bands of the maps
+    maxSunAlt : float, degrees
+        maximum sun altitude at which the maps were calculated
+    mode : string, defaults to 'r'
+        mode used to open the memory mapped files
+    """
+    metadataFile = 'skymaps.json'
+
+    def __init__(self, cacheDir, mjdStart, numTimes, nside, dt,
+                 bands='ugrizy', maxSunAlt=-12., mode='r'):
+        self.cacheDir = cacheDir
+        self.mjdStart = mjdStart
+        self.numTimes = numTimes
+        self.nside = nside
+        self.dt = dt
+        self.bands = list(bands)
+        self.maxSunAlt = maxSunAlt
+        self.npix = hp.nside2npix(nside)
+        self.maps = dict((band, np.memmap(self.mapFile(band),
+                                          dtype=np.float32, mode=mode,
+                                          shape=(numTimes, self.npix)))
+                         for band in self.bands)
+
+    def mapFile(self, band):
+        return os.path.join(self.cacheDir, 'skymags_{}.dat'.format(band))
+
+    @property
+    def mjds(self):
+        """
+        times of the grid in MJD
+        """
+        return self.mjdStart + self.dt * np.arange(self.numTimes)
+
+    @classmethod
+    def fromDirectory(cls, cacheDir):
+        """
+        open an existing cache in `cacheDir` in read only mode
+        """
+        with open(os.path.join(cacheDir, cls.metadataFile), 'r') as f:
+            meta = json.load(f)
+        return cls(cacheDir, mode='r', **meta)
+
+    @classmethod
+    def build(cls, cacheDir, sm, hwBandPassDict, mjdStart, mjdEnd,
+              nside=32, dt=10. / 60. / 24., bands='ugrizy',
+              maxSunAlt=-12., site=None, pixelBlockSize=2048):
+        """
+        Calculate the sky magnitude maps with the sky model `sm` and write
+        them to `cacheDir`. The sky model is evaluated at the centers of
+        the pixels, as for the HEALPix maps distributed with
+        `sims_skybrightness`, but with `returnMags` in the bandpasses
+        `hwBandPassDict` rather than with `mags=True`, which uses the
+        bandpasses bundled with the sky model, so that the maps match
+        `SkyCalculations.calculatePointings`.
+
+        Parameters
+        ----------
+        cacheDir : string
+            directory to write the cache to, created if it does not exist
+        sm : `lsst.sims.skybrightness.SkyModel` instance
+            sky model used for the calculation, set at all pixels at once
+            for each time in the grid
+        hwBandPassDict : `lsst.sims.photUtils.BandpassDict`
+            bandpasses used to calculate the sky magnitudes
+        mjdStart : float
+            first time in MJD
+        mjdEnd : float
+            last time in MJD (included in the grid, which has at least two
+            times)
+        nside : int, defaults to 32
+            HEALPix nside of the maps
+        dt : float, unit days, defaults to 10 minutes
+            spacing of the time grid
+        bands : string or sequence of strings, defaults to 'ugrizy'
+            bands of the maps
+        maxSunAlt : float, degrees, defaults to -12.
+            grid times with the sun above this altitude are skipped
+        site : `lsst.sims.utils.Site` instance, defaults to `None`
+            site used to calculate the sun altitude. Must be provided if
+            `maxSunAlt` is not `None`
+        pixelBlockSize : int, defaults to 2048
+            number of pixels sent to the sky model at once, limiting the
+            memory used by the spectra
+        """
+        if not os.path.exists(cacheDir):
+            os.makedirs(cacheDir)
+        numTimes = int(np.floor((mjdEnd - mjdStart) / dt + 1.0e-8)) + 1
+        numTimes = max(numTimes, 2)
+        meta = dict(mjdStart=mjdStart, numTimes=numTimes, nside=nside, dt=dt,
+                    bands=list(bands), maxSunAlt=maxSunAlt)
+        with open(os.path.join(cacheDir, cls.metadataFile), 'w') as f:
+            json.dump(meta, f)
+        cache = cls(cacheDir, mode='w+', **meta)
+
+        theta, phi = hp.pix2ang(nside, np.arange(cache.npix))
+        ra = phi
+        dec = np.pi / 2.0 - theta
+
+        mjds = cache.mjds
+        calculate = np.ones(numTimes, dtype=bool)
+        if maxSunAlt is not None:
+            sunRA, sunDec = approxSunRaDec(mjds)
+            sunAlt, _ = approxAltAz(sunRA, sunDec, mjds, site)
+            calculate = sunAlt <= maxSunAlt
+
+        for i, mjd in enumerate(mjds):
+            if not calculate[i]:
+                for band in cache.bands:
+                    cache.maps[band][i] = np.nan
+                continue
+            for start in range(0, cache.npix, pixelBlockSize):
+                block = slice(start, start + pixelBlockSize)
+                sm.setRaDecMjd(lon=ra[block], lat=dec[block],
+                               filterNames=cache.bands, mjd=mjd,
+                               degrees=False, azAlt=False)
+                mags = sm.returnMags(bandpasses=hwBandPassDict)
+                for band in cache.bands:
+                    cache.maps[band][i, block] = mags[band]
+        for band in cache.bands:
+            cache.maps[band].flush()
+        return cls.fromDirectory(cacheDir)
+
+    def skymags(self, bandNames, ra, dec, mjd):
+        """
+        Sky magnitudes interpolated bilinearly on the sphere and linearly in
+        time. Positions with any of the neighbouring map values undefined,
+        or times outside the grid return `np.nan`.
+
+        Parameters
+        ----------
+        bandNames : array-like of strings
+            bands of the pointings
+        ra : array-like, radians
+        dec : array-like, radians
+        mjd : array-like
+            times in MJD
+
+        Returns
+        -------
+        skymags : `np.ndarray` of floats
+        """
+        ra = np.ravel(ra)
+        dec = np.ravel(dec)
+        mjd = np.ravel(mjd)
+        bandNames = np.ravel(bandNames)
+
+        pix, weights = hp.get_interp_weights(self.nside, np.pi / 2.0 - dec,
+                                             ra)
+        x = (mjd - self.mjdStart) / self.dt
+        inRange = (x >= 0.) & (x <= self.numTimes - 1)
+        idx = np.clip(np.floor(x).astype(np.int64), 0, self.numTimes - 2)
+        frac = np.clip(x - idx, 0., 1.)
+
+        skymags = np.full(len(mjd), np.nan)
+        for band in self.bands:
+            sel = np.flatnonzero((bandNames == band) & inRange)
+            if len(sel) == 0:
+                continue
+            maps = self.maps[band]
+            p = pix[:, sel]
+            w = weights[:, sel]
+            before = (maps[idx[sel][np.newaxis, :], p] * w).sum(axis=0)
+            after = (maps[idx[sel][np.newaxis, :] + 1, p] * w).sum(axis=0)
+            skymags[sel] = (1.0 - frac[sel]) * before + frac[sel] * after
+        return skymags
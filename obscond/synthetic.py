@@ -0,0 +1,200 @@
+"""
+Deterministic generator of synthetic, survey like tables of pointings of any
+size, for load testing the calculations on realistic inputs. The tables are
+generated night by night and streamed in chunks, so that they never have to
+fit in memory.
+"""
+from __future__ import absolute_import, division, print_function
+__all__ = ['syntheticPointings', 'writeSyntheticPointings']
+
+import sqlite3
+import numpy as np
+import pandas as pd
+from lsst.sims.utils import Site
+from .coordinates import approxLST, approxSunRaDec, fastAltAz
+from .historicalWeatherData import WeatherData
+from .seeingmodel import seeingConditions
+
+# Fraction of visits in each band, roughly as in OpSim baselines
+bandFractions = dict(u=0.07, g=0.10, r=0.22, i=0.22, z=0.20, y=0.19)
+
+
+def _darkTime(start, site, twilightAlt):
+    """
+    Start and end in MJD of the first night after `start` (or the night in
+    progress at `start`) in which the sun is below `twilightAlt` degrees,
+    to a minute. The sun is below `twilightAlt` at both times.
+    """
+    mjd = start + np.arange(2 * 1440 + 1) / 1440.0
+    sunRA, sunDec = approxSunRaDec(mjd)
+    sunAlt, _ = fastAltAz(sunRA, sunDec, mjd, site, ofDate=True)
+    dark = sunAlt <= twilightAlt
+    evening = np.argmax(dark)
+    morning = evening + np.argmin(dark[evening:]) - 1
+    return mjd[evening], mjd[morning]
+
+
+def _night(night, seed, surveyStart, site, weather, visitsPerNight,
+           maxHourAngle, decRange, ditherRadius, twilightAlt):
+    """
+    Pointings of a single night, determined by `seed` and `night` only
+    """
+    rng = np.random.RandomState([seed, night])
+    num = rng.poisson(visitsPerNight)
+
+    # Visits of 34s (2 x 15s exposures, shutter and readout) separated by
+    # slews of a few seconds, between evening and morning twilight
+    evening, morning = _darkTime(surveyStart + night, site, twilightAlt)
+    nightStart = evening + rng.uniform(0., 0.02)
+    visitTime = 34.0 + rng.exponential(5.0, size=num)
+    mjd = nightStart + np.cumsum(visitTime) / 86400.0
+    num = np.searchsorted(mjd, morning)
+    mjd = mjd[:num]
+
+    # Bands change in blocks of visits
+    bands = np.array(sorted(bandFractions))
+    fractions = np.array(list(bandFractions[band] for band in bands))
+    blockLengths = rng.randint(30, 120, size=num // 30 + 1)
+    blockBands = rng.choice(bands, size=len(blockLengths), p=fractions)
+    bandNames = np.repeat(blockBands, blockLengths)[:num]
+
+    # Fields close to the meridian, uniformly distributed in solid angle
+    lat = np.radians(site.latitude)
+    sinDec = rng.uniform(np.sin(np.radians(decRange[0])),
+                         np.sin(np.radians(decRange[1])), size=num)
+    dec = np.arcsin(sinDec)
+    hourAngle = np.radians(rng.uniform(-maxHourAngle, maxHourAngle,
+                                       size=num) * 15.0)
+    lst = np.radians(approxLST(mjd, site.longitude))
+    ra = (lst - hourAngle) % (2.0 * np.pi)
+    sinAlt = np.sin(dec) * np.sin(lat) + \
+        np.cos(dec) * np.cos(lat) * np.cos(hourAngle)
+    airmass = 1.0 / np.clip(sinAlt, 0.05, 1.0)
+
+    # Dithers uniformly distributed within `ditherRadius` degrees
+    offset = np.radians(ditherRadius) * np.sqrt(rng.uniform(size=num))
+    angle = rng.uniform(0., 2.0 * np.pi, size=num)
+    ditheredDec = np.clip(dec + offset * np.sin(angle), -np.pi / 2.,
+                          np.pi / 2.)
+    ditheredRA = (ra + offset * np.cos(angle) / np.cos(dec)) % (2.0 * np.pi)
+
+    rawSeeing, FWHMeff, _ = seeingConditions(mjd, bandNames, airmass, weather,
+                                             surveyStart=surveyStart)
+    return pd.DataFrame(dict(fieldRA=ra, fieldDec=dec,
+                             ditheredRA=ditheredRA, ditheredDec=ditheredDec,
+                             filter=bandNames, expMJD=mjd,
+                             night=np.repeat(night, num),
+                             propID=np.repeat(54, num),
+                             airmass=airmass, rawSeeing=rawSeeing,
+                             FWHMeff=FWHMeff),
+                        columns=['fieldRA', 'fieldDec', 'ditheredRA',
+                                 'ditheredDec', 'filter', 'expMJD', 'night',
+                                 'propID', 'airmass', 'rawSeeing', 'FWHMeff'])
+
+
+def syntheticPointings(numPointings, seed=0, chunksize=100000,
+                       surveyStart=59580.0, visitsPerNight=800,
+                       maxHourAngle=2.0, decRange=(-80., 5.),
+                       ditherRadius=1.75, twilightAlt=-12., weatherData=None,
+                       site=None):
+    """
+    Generator of chunks of synthetic pointings with OpSim column names and
+    units (angles in radians), indexed by `obsHistID`. The pointings are
+    ordered in time, night by night, and a given night only depends on
+    `seed` and the night, so that the pointings do not depend on
+    `chunksize`. Chunks hold whole nights, and so may be longer than
+    `chunksize` by up to a night of visits. Each night starts at the evening
+    twilight following `surveyStart + night` (or at this time if the sun is
+    already down) and visits stop at the morning twilight.
+
+    Parameters
+    ----------
+    numPointings : int
+        total number of pointings
+    seed : int, defaults to 0
+        seed of the random numbers
+    chunksize : int, defaults to 100000
+        approximate number of pointings in each chunk
+    surveyStart : float, defaults to 59580.
+        MJD of the start of the first night
+    visitsPerNight : int, defaults to 800
+        mean number of visits in a night, before dropping those after the
+        morning twilight
+    maxHourAngle : float, unit hours, defaults to 2.
+        fields are observed within this hour angle of the meridian
+    decRange : tuple of floats, unit degrees, defaults to (-80., 5.)
+        range of declinations of the fields
+    ditherRadius : float, unit degrees, defaults to 1.75
+        maximal distance of the dithered position from the field
+    twilightAlt : float, unit degrees, defaults to -12.
+        visits are taken while the sun is below this altitude, computed with
+        `approxSunRaDec` and `fastAltAz`
+    weatherData : `obscond.WeatherData`, defaults to `None`
+        source of the raw seeing, if `None` the seeing history of the
+        example data is used
+    site : `lsst.sims.utils.Site`, defaults to `None`
+        if `None`, the LSST site is used
+
+    Returns
+    -------
+    generator of `pd.DataFrame`
+    """
+    if weatherData is None:
+        weatherData = WeatherData.fromTxtFiles()
+    if site is None:
+        site = Site('LSST')
+
+    night = 0
+    numDone = 0
+    buf = []
+    bufLen = 0
+    while numDone < numPointings:
+        df = _night(night, seed, surveyStart, site, weatherData,
+                    visitsPerNight, maxHourAngle, decRange, ditherRadius,
+                    twilightAlt)
+        df = df.iloc[:numPointings - numDone]
+        df.index = pd.Index(np.arange(numDone, numDone + len(df)) + 1,
+                            name='obsHistID')
+        buf.append(df)
+        bufLen += len(df)
+        numDone += len(df)
+        night += 1
+        if bufLen >= chunksize or numDone == numPointings:
+            yield pd.concat(buf)
+            buf = []
+            bufLen = 0
+
+
+def writeSyntheticPointings(fname, numPointings, tableName='Summary',
+                            **kwargs):
+    """
+    Stream synthetic pointings to `fname`, chunk by chunk. Files ending in
+    `.db` or `.sqlite` are written as a SQLite table `tableName` which can
+    be read with `obscond.readOpSimPointings` (and `obscond recalc`), other
+    files are written as csv.
+
+    Parameters
+    ----------
+    fname : string
+        output file, overwritten if it exists
+    numPointings : int
+        total number of pointings
+    tableName : string, defaults to 'Summary'
+    kwargs :
+        keyword arguments of `syntheticPointings`
+    """
+    chunks = syntheticPointings(numPointings, **kwargs)
+    if fname.endswith('.db') or fname.endswith('.sqlite'):
+        conn = sqlite3.connect(fname)
+        try:
+            conn.execute('DROP TABLE IF EXISTS {}'.format(tableName))
+            for df in chunks:
+                df.to_sql(tableName, conn, if_exists='append')
+            conn.execute('CREATE INDEX IF NOT EXISTS {0}_obsHistID ON {0} '
+                         '(obsHistID)'.format(tableName))
+            conn.commit()
+        finally:
+            conn.close()
+    else:
+        for j, df in enumerate(chunks):
+            df.to_csv(fname, mode='w' if j == 0 else 'a', header=(j == 0))
@@ -0,0 +1,207 @@
+"""
+One pass validation of recalculated five sigma depths against reference
+values (eg. the `fiveSigmaDepth` of OpSim), chunk by chunk as results are
+produced. Residual statistics are accumulated per band and airmass bin in
+arrays of fixed size, so that memory does not depend on the number of
+pointings.
+"""
+from __future__ import absolute_import, division, print_function
+__all__ = ['M5ResidualStats']
+
+import numpy as np
+import pandas as pd
+
+
+class M5ResidualStats(object):
+    """
+    Running statistics of the residuals `valueCol - referenceCol` in bins of
+    band and airmass: counts, mean, variance, extrema, approximate quantiles
+    from a fixed histogram, and counts of outliers and invalid values.
+
+    Parameters
+    ----------
+    referenceCol : string, defaults to 'fiveSigmaDepth'
+        column of reference values
+    valueCol : string, defaults to 'fieldm5'
+        column of recalculated values
+    bandCol : string, defaults to 'filter'
+    airmassCol : string, defaults to 'airmass'
+    bands : string or sequence of strings, defaults to 'ugrizy'
+        bands for which statistics are kept, other rows are skipped
+    airmassEdges : array-like, defaults to 1.0, 1.1, ..., 2.5
+        edges of the airmass bins. Airmasses outside the edges are counted
+        in the first or last bin
+    outlierThreshold : float, unit mag, defaults to 0.05
+        residuals larger in absolute value are counted as outliers
+    histRange : float, unit mag, defaults to 0.5
+        the quantiles are estimated from a histogram of residuals in
+        [-histRange, histRange]
+    histBinSize : float, unit mag, defaults to 0.001
+        bin size of the histogram, and so the resolution of the quantiles
+
+    Examples
+    --------
+    The instance can be used as the writer of `calculatePointingsPipelined`,
+    or fed chunks of any other source of results
+
+    >>> stats = M5ResidualStats() # doctest: +SKIP
+    >>> for df in chunks: stats.update(df) # doctest: +SKIP
+    >>> stats.summary() # doctest: +SKIP
+    """
+    def __init__(self, referenceCol='fiveSigmaDepth', valueCol='fieldm5',
+                 bandCol='filter', airmassCol='airmass', bands='ugrizy',
+                 airmassEdges=None, outlierThreshold=0.05, histRange=0.5,
+                 histBinSize=0.001):
+        if airmassEdges is None:
+            airmassEdges = np.arange(1.0, 2.51, 0.1)
+        self.referenceCol = referenceCol
+        self.valueCol = valueCol
+        self.bandCol = bandCol
+        self.airmassCol = airmassCol
+        self.bands = list(bands)
+        self.airmassEdges = np.asarray(airmassEdges, dtype=np.float64)
+        self.outlierThreshold = outlierThreshold
+        self.histRange = histRange
+        self.histBinSize = histBinSize
+
+        self.numAirmassBins = len(self.airmassEdges) - 1
+        numBins = len(self.bands) * self.numAirmassBins
+        # Two extra histogram bins for residuals beyond -/+ histRange
+        self.numHistBins = int(round(2. * histRange / histBinSize)) + 2
+        self.count = np.zeros(numBins, dtype=np.int64)
+        self.mean = np.zeros(numBins)
+        self.m2 = np.zeros(numBins)
+        self.min = np.repeat(np.inf, numBins)
+        self.max = np.repeat(-np.inf, numBins)
+        self.numOutliers = np.zeros(numBins, dtype=np.int64)
+        self.numInvalid = np.zeros(numBins, dtype=np.int64)
+        self.hist = np.zeros((numBins, self.numHistBins), dtype=np.int64)
+        self.numSkipped = 0
+
+    def _binIndex(self, df):
+        """
+        index of the (band, airmass) bin of each row of `df`, -1 for rows of
+        other bands
+        """
+        bandIdx = np.repeat(-1, len(df))
+        bandNames = df[self.bandCol].values
+        for i, band in enumerate(self.bands):
+            bandIdx[bandNames == band] = i
+        airmassIdx = np.searchsorted(self.airmassEdges,
+                                     df[self.airmassCol].values,
+                                     side='right') - 1
+        airmassIdx = np.clip(airmassIdx, 0, self.numAirmassBins - 1)
+        return np.where(bandIdx >= 0,
+                        bandIdx * self.numAirmassBins + airmassIdx, -1)
+
+    def update(self, df):
+        """
+        Add the residuals of the results `df` to the statistics
+        """
+        numBins = len(self.count)
+        idx = self._binIndex(df)
+        known = idx >= 0
+        self.numSkipped += np.sum(~known)
+        resid = (df[self.valueCol].values.astype(np.float64) -
+                 df[self.referenceCol].values.astype(np.float64))[known]
+        idx = idx[known]
+
+        valid = np.isfinite(resid)
+        self.numInvalid += np.bincount(idx[~valid], minlength=numBins)
+        resid = resid[valid]
+        idx = idx[valid]
+        if len(resid) == 0:
+            return
+
+        # Combine the moments of the chunk with the running moments
+        count = np.bincount(idx, minlength=numBins)
+        sums = np.bincount(idx, weights=resid, minlength=numBins)
+        nonzero = count > 0
+        mean = np.zeros(numBins)
+        mean[nonzero] = sums[nonzero] / count[nonzero]
+        m2 = np.bincount(idx, weights=(resid - mean[idx]) ** 2,
+                         minlength=numBins)
+        total = self.count + count
+        delta = mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            frac = np.where(total > 0, count / total, 0.)
+        self.m2 += m2 + delta ** 2 * self.count * frac
+        self.mean += delta * frac
+        self.count = total
+
+        np.minimum.at(self.min, idx, resid)
+        np.maximum.at(self.max, idx, resid)
+        self.numOutliers += np.bincount(
+            idx[np.abs(resid) > self.outlierThreshold], minlength=numBins)
+
+        histIdx = np.floor((resid + self.histRange) /
+                           self.histBinSize).astype(np.int64) + 1
+        histIdx = np.clip(histIdx, 0, self.numHistBins - 1)
+        self.hist += np.bincount(idx * self.numHistBins + histIdx,
+                                 minlength=self.hist.size
+                                 ).reshape(self.hist.shape)
+
+    def __call__(self, j, df):
+        self.update(df)
+
+    def merge(self, other):
+        """
+        Add the statistics of `other`, an instance with the same binning,
+        eg. accumulated on another shard of the pointings
+        """
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            frac = np.where(total > 0, other.count / total, 0.)
+        self.m2 += other.m2 + delta ** 2 * self.count * frac
+        self.mean += delta * frac
+        self.count = total
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.numOutliers += other.numOutliers
+        self.numInvalid += other.numInvalid
+        self.hist += other.hist
+        self.numSkipped += other.numSkipped
+        return self
+
+    def quantiles(self, q):
+        """
+        array of shape (number of bins, len(q)) of the quantiles `q` of the
+        residuals in each bin, with a resolution of `histBinSize`. Quantiles
+        falling beyond `histRange` are returned as -/+ `np.inf`
+        """
+        q = np.ravel(q)
+        cumulative = np.cumsum(self.hist, axis=1)
+        edges = np.concatenate(([-np.inf],
+                                -self.histRange + self.histBinSize *
+                                np.arange(1, self.numHistBins - 1),
+                                [np.inf]))
+        res = np.repeat(np.nan, len(self.count) * len(q)).reshape(
+            len(self.count), len(q))
+        for i in np.flatnonzero(self.count):
+            pos = np.searchsorted(cumulative[i], q * self.count[i],
+                                  side='left')
+            res[i] = edges[np.clip(pos, 0, self.numHistBins - 1)]
+        return res
+
+    def summary(self, quantiles=(0.05, 0.5, 0.95)):
+        """
+        `pd.DataFrame` of the statistics, indexed by band and the lower edge
+        of the airmass bin, for bins with at least one value
+        """
+        index = pd.MultiIndex.from_product([self.bands,
+                                            self.airmassEdges[:-1]],
+                                           names=['band', 'airmass'])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(self.m2 / (self.count - 1))
+        df = pd.DataFrame(dict(count=self.count, mean=self.mean, std=std,
+                               min=self.min, max=self.max,
+                               numOutliers=self.numOutliers,
+                               numInvalid=self.numInvalid),
+                          index=index,
+                          columns=['count', 'mean', 'std', 'min', 'max',
+                                   'numOutliers', 'numInvalid'])
+        qs = self.quantiles(quantiles)
+        for j, q in enumerate(quantiles):
+            df['q{:g}'.format(100 * q)] = qs[:, j]
+        return df[(self.count > 0) | (self.numInvalid > 0)]
@@ -0,0 +1,106 @@
+"""
+Error budget and throughput of the batch photometry modes of `obscond`.
+
+The sky spectra of a set of synthetic pointings are calculated once with the
+sky model. Sky magnitudes and five sigma depths are then calculated from the
+same spectra spectrum by spectrum with `Sed` and `calcM5` (the float64
+reference used by `SkyCalculations.calculatePointings`), and with
+`BatchPhotometry` in each mode. For each mode, the script prints the
+largest absolute differences to the reference per band and airmass bin and
+the number of spectra processed per second, and writes the same table for
+all modes to `--output`.
+
+Usage:
+    - Setup the lsst sims stack
+    - `python benchmark_batch_photometry.py --num 2000 --output errors.csv`
+"""
+from __future__ import absolute_import, division, print_function
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from lsst.sims.photUtils import BandpassDict, Sed
+import obscond as oc
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num', type=int, default=2000,
+                        help='number of pointings')
+    parser.add_argument('--steps', type=int, nargs='+', default=[1, 2, 4],
+                        help='wavelength steps of the float32 modes')
+    parser.add_argument('--output', default='batch_photometry_errors.csv',
+                        help='csv file of the errors and rates of the modes')
+    args = parser.parse_args()
+
+    _, hwbpdict = BandpassDict.loadBandpassesFromFiles()
+    skycalc = oc.SkyCalculations(photparams='LSST', hwBandpassDict=hwbpdict)
+    pointings = next(oc.syntheticPointings(args.num, chunksize=args.num))
+    pointings = pointings.iloc[:args.num]
+    pointings = pointings[skycalc.observableMask(pointings.fieldRA.values,
+                                                 pointings.fieldDec.values,
+                                                 pointings.expMJD.values)]
+
+    # sky spectra of the pointings, calculated once
+    sm = skycalc.sm
+    bandNames = pointings['filter'].values
+    FWHMeffs = pointings.FWHMeff.values
+    airmass = np.zeros(len(pointings))
+    specs = []
+    for i, (ra, dec, mjd) in enumerate(zip(pointings.fieldRA.values,
+                                           pointings.fieldDec.values,
+                                           pointings.expMJD.values)):
+        sm.setRaDecMjd(lon=[ra], lat=[dec], filterNames=bandNames[i],
+                       mjd=mjd, degrees=False, azAlt=False)
+        wave, spec = sm.returnWaveSpec()
+        specs.append(spec[0])
+        airmass[i] = np.ravel(sm.airmass)[0]
+    specs = np.array(specs)
+    ok = np.all(np.isfinite(specs), axis=1)
+    specs, bandNames, FWHMeffs, airmass = (specs[ok], bandNames[ok],
+                                           FWHMeffs[ok], airmass[ok])
+    print('{} spectra of {} wavelengths'.format(*specs.shape))
+
+    tstart = time.time()
+    skymags = np.array(list(Sed(wavelen=wave, flambda=spec).calcMag(
+        hwbpdict[band]) for spec, band in zip(specs, bandNames)))
+    depths = np.array(list(skycalc._fiveSigmaDepthFromSpec(band, fwhm, wave,
+                                                           spec, x)
+                           for band, fwhm, spec, x in zip(bandNames,
+                                                          FWHMeffs, specs,
+                                                          airmass)))
+    referenceRate = len(specs) / (time.time() - tstart)
+    print('reference (Sed, calcM5): {0:.0f} spectra/s'.format(referenceRate))
+
+    airmassBins = pd.cut(airmass, [1.0, 1.25, 1.5, 2.0, 2.5, np.inf],
+                         include_lowest=True)
+    modes = [('float64', 1)] + list(('float32', step) for step in args.steps)
+    summaries = []
+    for precision, step in modes:
+        photometry = skycalc.batchPhotometry(precision=precision,
+                                             wavelengthStep=step)
+        # first call sets up the weights and reference depths
+        photometry.fiveSigmaDepths(bandNames, FWHMeffs, airmass, wave, specs)
+        tstart = time.time()
+        counts = photometry.skyCounts(bandNames, wave, specs)
+        batchSkymags = photometry.skymagsFromCounts(bandNames, counts)
+        batchDepths = photometry.fiveSigmaDepths(bandNames, FWHMeffs,
+                                                 airmass, wave, specs,
+                                                 counts=counts)
+        rate = len(specs) / (time.time() - tstart)
+        df = pd.DataFrame(dict(band=bandNames, airmass=airmassBins,
+                               dSkyBrightness=np.abs(batchSkymags - skymags),
+                               dFiveSigmaDepth=np.abs(batchDepths - depths)))
+        print('\n{0}: {1:.0f} spectra/s ({2:.0f} x reference)'.format(
+            photometry, rate, rate / referenceRate))
+        summary = df.groupby(['band', 'airmass'], observed=True).agg('max')
+        print(summary)
+        summary['precision'] = precision
+        summary['wavelengthStep'] = step
+        summary['speedup'] = rate / referenceRate
+        summaries.append(summary.reset_index())
+    pd.concat(summaries).to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Errors and speed of the coordinate tiers of `SkyCalculations`.
+
+Altitudes, azimuths and airmasses of synthetic pointings are calculated with
+the precise transformations of `lsst.sims.utils` (the reference of the
+'precise' tier), with `approx_RaDec2AltAz` (the 'approximate' tier) and with
+`obscond.fastAltAz` (the 'fast' tier). For each approximation, the script
+prints the distribution of the errors and the number of pointings
+transformed per second. It then times `calculatePointings` in each tier,
+and prints the largest differences of the airmasses, sky magnitudes and
+depths of the 'approximate' and 'fast' tiers from the 'precise' tier for
+airmasses below 2.5.
+
+Usage:
+    - Setup the lsst sims stack
+    - `python benchmark_coordinates.py --num 100000`
+"""
+from __future__ import absolute_import, division, print_function
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from lsst.sims.photUtils import BandpassDict
+from lsst.sims.utils import Site, ObservationMetaData, _altAzPaFromRaDec
+import obscond as oc
+
+
+def precise(ra, dec, mjd, site):
+    """
+    precise altitudes and azimuths in degrees, one time at a time
+    """
+    alt = np.zeros(len(ra))
+    az = np.zeros(len(ra))
+    for i in range(len(ra)):
+        obs = ObservationMetaData(mjd=mjd[i], site=site)
+        a, z, _ = _altAzPaFromRaDec(np.radians(ra[i:i + 1]),
+                                    np.radians(dec[i:i + 1]), obs)
+        alt[i], az[i] = np.degrees(a[0]), np.degrees(z[0])
+    return alt, az
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num', type=int, default=100000,
+                        help='number of pointings for the transformations')
+    parser.add_argument('--numPrecise', type=int, default=2000,
+                        help='number of pointings for the precise reference')
+    parser.add_argument('--numPointings', type=int, default=500,
+                        help='number of pointings for calculatePointings')
+    args = parser.parse_args()
+
+    site = Site('LSST')
+    pointings = pd.concat(oc.syntheticPointings(args.num, chunksize=args.num))
+    ra = np.degrees(pointings.fieldRA.values)
+    dec = np.degrees(pointings.fieldDec.values)
+    mjd = pointings.expMJD.values
+
+    timings = dict()
+    results = dict()
+    for name, func in (('approximate', oc.approxAltAz),
+                       ('fast', oc.fastAltAz)):
+        tstart = time.time()
+        results[name] = func(ra, dec, mjd, site)
+        timings[name] = args.num / (time.time() - tstart)
+    n = args.numPrecise
+    tstart = time.time()
+    reference = precise(ra[:n], dec[:n], mjd[:n], site)
+    timings['precise'] = n / (time.time() - tstart)
+
+    refAirmass = oc.airmassFromAltitude(reference[0])
+    for name in ('approximate', 'fast'):
+        alt, az = (x[:n] for x in results[name])
+        df = pd.DataFrame(dict(
+            dAlt=alt - reference[0],
+            dAz=(az - reference[1] + 180.) % 360. - 180.,
+            dAirmassFrac=oc.airmassFromAltitude(alt) / refAirmass - 1.))
+        print('\n{0}: {1:.3g} pointings/s ({2:.0f} x precise)'.format(
+            name, timings[name], timings[name] / timings['precise']))
+        print(df[reference[0] > 20.].describe(percentiles=[0.5, 0.99]))
+
+    _, hwbpdict = BandpassDict.loadBandpassesFromFiles()
+    chunk = pointings.iloc[:args.numPointings]
+    print('\ncalculatePointings on {} pointings'.format(len(chunk)))
+    tiers = dict()
+    for tier in oc.SkyCalculations.coordinateTiers:
+        skycalc = oc.SkyCalculations(photparams='LSST',
+                                     hwBandpassDict=hwbpdict,
+                                     coordinateTier=tier)
+        tstart = time.time()
+        tiers[tier] = skycalc.calculatePointings(chunk)
+        print('{0}: {1:.1f} pointings/s'.format(
+            tier, len(chunk) / (time.time() - tstart)))
+
+    reference = tiers['precise']
+    sel = reference.airmass < 2.5
+    for tier in ('approximate', 'fast'):
+        df = tiers[tier]
+        diffs = pd.DataFrame(dict(
+            dAirmassFrac=df.airmass / reference.airmass - 1.,
+            dSkyBrightness=df.filtSkyBrightness - reference.filtSkyBrightness,
+            dFiveSigmaDepth=df.fiveSigmaDepth - reference.fiveSigmaDepth))
+        print('\n{} - precise, airmass < 2.5'.format(tier))
+        print(diffs[sel].abs().describe(percentiles=[0.5, 0.99]))
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,8 @@ This script can be used to re-calculate skybrightnesses `filtSkyBrightness` and
 Prerequisites:
     - the `lsst.sims` package must be installed and setup correctly.
     - `OpSimSummary` must be installed
-    - joblib is required for parallelization on a multi-processor machine
+    - joblib (>= 1.3) is required for parallelization on a multi-processor
+      machine
     - pandas with hdf5 capabilities
 
 Usage:
@@ -14,6 +15,8 @@ Usage:
 
 Output:
     - A set of hdf5 files and log files  
+    - `m5residuals.csv` with statistics of the differences between the
+      recalculated and OpSim five sigma depths per band and airmass bin
 
 """
 # This script is run when the LSST Sims  package is installed and setup
@@ -29,6 +32,7 @@ from lsst.sims.photUtils import Bandpass, BandpassDict
 import lsst.sims.skybrightness as sb
 from opsimsummary import OpSimOutput
 from lsst.utils import getPackageDir
+from obscond import M5ResidualStats
 import sys
 sys.stdout.flush()
 
@@ -71,26 +75,24 @@ splits = 40
 dfs = np.array_split(df, splits)
 print('splitting dataframe of size {0} into {1} splits each of size {2}'.format(len(df), splits, len(dfs[0])))
 
-calcdfs = []
-def recalcmags(j, lst=calcdfs):
+def recalcmags(j):
     logfname = 'newres_{}.log'.format(j)
     with open(logfname, 'w') as f:
         f.write('starting split {} \n'.format(j))
     # print('starting split ', j)
     df = dfs[j]
     sm = sb.SkyModel(observatory='LSST', mags=False, preciseAltAz=True)
-    i = 0
     fieldmags = np.zeros(len(df), dtype=np.float)
     skymags = np.zeros(len(df), dtype=np.float)
-
-    # ditheredmags = np.zeros(len(df), dtype=np.float)    
-    for obsHistID, row in df.iterrows():
+    ditheredmags = np.zeros(len(df), dtype=np.float)
+    for i, (obsHistID, row) in enumerate(df.iterrows()):
         bandname = row['filter']
         airmass = row['airmass']
         # The Skybrightness Model only has support for airmass <=2.5
         if airmass > 2.5:
             skymags[i] = np.nan
             fieldmags[i] = np.nan
+            ditheredmags[i] = np.nan
             continue
 
         # Get atmospheric transmission for airmass of pointing
@@ -98,7 +100,10 @@ def recalcmags(j, lst=calcdfs):
         atmTrans = np.loadtxt(fname)
         wave, trans = hwbpdict[bandname].multiplyThroughputs(atmTrans[:, 0], atmTrans[:, 1]) 
         bp = Bandpass(wavelen=wave, sb=trans)
-        sm.setRaDecMjd(lon=[row['fieldRA']], lat=[row['fieldDec']], filterNames=[row['filter']],
+        # The field and dithered positions are evaluated in a single call
+        sm.setRaDecMjd(lon=[row['fieldRA'], row['ditheredRA']],
+                       lat=[row['fieldDec'], row['ditheredDec']],
+                       filterNames=row['filter'],
                        mjd=row['expMJD'], degrees=False, azAlt=False)
         
         wave, spec = sm.returnWaveSpec()
@@ -106,26 +111,22 @@ def recalcmags(j, lst=calcdfs):
         skymags[i] = sm.returnMags(bandpasses=hwbpdict)[row['filter']][0]
         fieldmags[i] = calcM5(sed, bp, hwbpdict[bandname], photparams, 
                               row['FWHMeff'])
-        #sm.setRaDecMjd(lon=row['ditheredRA'], lat=row['ditheredDec'], filterNames=row['filter'],
-        #               mjd=row['expMJD'], degrees=False, azAlt=False)
-        
-        # sed = Sed(wavelen=wave, flambda=spec[1])
-        # ditheredmags[i] = calcM5(sed, bp, hwbpdict[bandname], photparams, 
-        #                         row['FWHMeff'])
-    
-        i += 1
-        if (i%1000) == 0:
+        sed = Sed(wavelen=wave, flambda=spec[1])
+        ditheredmags[i] = calcM5(sed, bp, hwbpdict[bandname], photparams,
+                                 row['FWHMeff'])
+
+        if ((i + 1) % 1000) == 0:
             with open(logfname, mode='a+') as f:
-                f.write('calculation done for {} th record\n'.format(i))
+                f.write('calculation done for {} th record\n'.format(i + 1))
 
     df['fieldm5'] = fieldmags
     df['skymags'] = skymags
-    #df['ditheredm5'] = ditheredmags
-    lst.append(df)
+    df['ditheredm5'] = ditheredmags
     # print('done')
 
     fname = 'newres{}.hdf'.format(j)
-    df = df[['fiveSigmaDepth', 'fieldm5','skymags', 'airmass', 'filter']]
+    df = df[['fiveSigmaDepth', 'fieldm5', 'ditheredm5', 'skymags', 'airmass',
+             'filter']]
     with open(logfname, mode='a+') as f:
         f.write('dataframe calculated')
     df.to_hdf(fname, key='0')
@@ -135,10 +136,22 @@ def recalcmags(j, lst=calcdfs):
         f.write('dataframe written')
     return df
 
-# ndf = Parallel(n_jobs=-1)(delayed(recalcmags)(j=j, lst=calcdfs) for j in range(2)) 
-ndf = Parallel(n_jobs=-1)(delayed(recalcmags)(j=j, lst=calcdfs) for j in range(splits)) 
-print('After loops are over, this is the number of dataframes', len(ndf))
-newdf = pd.concat(ndf)
-print('number of lines {}'.format(len(newdf)))
-newdf.to_hdf('newOpSim.hdf', key='0')
+# Residuals of the recalculated depths with respect to the OpSim values,
+# accumulated as each split is returned rather than once all are done, and
+# each split appended to `newOpSim.hdf` and dropped, so that the results of
+# all splits are never held in memory at once
+residuals = M5ResidualStats(referenceCol='fiveSigmaDepth', valueCol='fieldm5')
+numLines = 0
+results = Parallel(n_jobs=-1, return_as='generator')(
+    delayed(recalcmags)(j=j) for j in range(splits))
+with pd.HDFStore('newOpSim.hdf', mode='w') as store:
+    for j, resdf in enumerate(results):
+        residuals(j, resdf)
+        store.append('0', resdf, format='table', min_itemsize=dict(filter=1))
+        numLines += len(resdf)
+        del resdf
+print('number of lines {}'.format(numLines))
+residualSummary = residuals.summary()
+print(residualSummary)
+residualSummary.to_csv('m5residuals.csv')
 print('DONE')
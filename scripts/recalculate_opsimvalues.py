@@ -5,7 +5,6 @@ This script can be used to re-calculate skybrightnesses `filtSkyBrightness` and
 Prerequisites:
     - the `lsst.sims` package must be installed and setup correctly.
     - `OpSimSummary` must be installed
-    - joblib is required for parallelization on a multi-processor machine
     - pandas with hdf5 capabilities
 
 Usage:
@@ -13,7 +12,8 @@ Usage:
     - `nohup python recalculate_m5.py > recalculate_m5.log 2>&1 &`
 
 Output:
-    - A set of hdf5 files and log files  
+    - An hdf5 file `newOpSim.hdf`, appended to as the calculations proceed,
+      and log files
 
 """
 # This script is run when the LSST Sims  package is installed and setup
@@ -23,7 +23,6 @@ import time
 import numpy as np
 import healpy as hp
 import pandas as pd
-from joblib import Parallel, delayed
 from lsst.sims.photUtils import Sed, calcM5, PhotometricParameters
 from lsst.sims.photUtils import Bandpass, BandpassDict
 import lsst.sims.skybrightness as sb
@@ -61,35 +60,30 @@ photparams = PhotometricParameters()
 
 # Split the entries in the opsim database for parallelization
 splits = 1000
-dfs = np.array_split(df, splits)
-print('splitting dataframe of size {0} into {1} splits each of size {2}\n'.format(len(df), splits, len(dfs[0])))
+boundaries = np.linspace(0, len(df), splits + 1).astype(np.int64)
+print('splitting dataframe of size {0} into {1} splits each of size {2}\n'.format(len(df), splits, boundaries[1]))
+pointingCols = ['fieldRA', 'fieldDec', 'ditheredRA', 'ditheredDec', 'filter',
+                'expMJD', 'FWHMeff']
 
-calcdfs = []
-def recalcmags(j):
-    logfname = 'newres_{}.log'.format(j)
-    tsplitstart = time.time()
-    with open(logfname, 'w') as f:
-        f.write('starting split {0} at time {1}\n'.format(j, tsplitstart))
-    df = dfs[j]
-    sm = sb.SkyModel(observatory='LSST', mags=False, preciseAltAz=True)
-    skycalc = obscond.SkyCalculations(photparams="LSST", hwBandpassDict=hwbpdict)
+def readsplits():
+    for j in range(splits):
+        yield df.iloc[boundaries[j]:boundaries[j + 1]][pointingCols]
 
-    fname = 'newres{}.hdf'.format(j)
-    df_res = skycalc.calculatePointings(df)
-    with open(logfname, mode='a+') as f:
-        f.write('dataframe calculated\n')
-    df_res.to_hdf(fname, key='0')
-    tsplitend = time.time()
-    with open(logfname, mode='a+') as f:
-        f.write('dataframe written at time {} \n'.format(tsplitend))
-        f.write('For dataframe of size {0} time taken is {1}\n'.format(len(df_res), tsplitend - tsplitstart))
-    return df_res
+# Results are appended to the output as each split completes, while the
+# next splits are being read and calculated
+store = pd.HDFStore('newOpSim.hdf', mode='w')
+def writesplit(j, df_res):
+    store.append('0', df_res)
+    with open('newres_{}.log'.format(j), mode='w') as f:
+        f.write('dataframe of size {0} written at time {1}\n'.format(len(df_res), time.time()))
 
-ndf = Parallel(n_jobs=-1)(delayed(recalcmags)(j=j) for j in range(splits)) 
-print('After loops are over, this is the number of dataframes\n', len(ndf))
-newdf = pd.concat(ndf)
-print('number of lines {}\n'.format(len(newdf)))
-newdf.to_hdf('newOpSim.hdf', key='0')
+summary = obscond.calculatePointingsPipelined(readsplits(), writesplit,
+                                              skyCalcKwargs=dict(photparams="LSST",
+                                                                 hwBandpassDict=hwbpdict),
+                                              calcKwargs=dict(extraCoordCols=dict(dithered=('ditheredRA', 'ditheredDec'))))
+store.close()
+print('After loops are over, this is the number of dataframes\n', summary['numChunks'])
+print('number of lines {}\n'.format(summary['numRows']))
 tend = time.time() 
 logger.info('End Program at time {} sec'.format(tend))
 logger.info('Time taken is {} sec'.format(tend - tstart))
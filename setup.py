@@ -19,6 +19,7 @@ setup(name='obscond',
       version=__version__,
       description='Interpolating Observing Conditions from historic data',
       packages=['obscond'],
+      scripts=['scripts/obscond'],
       package_dir={'obscond': 'obscond'},
       package_data={'obscond': ['example_data/*.txt', 'example_data/*.md',
                                 'example_data/*.csv']},
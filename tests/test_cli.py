@@ -0,0 +1,37 @@
+from obscond.cli import parseShard, parseExtraCoords, _parser
+import argparse
+import unittest
+
+
+class TestCommandLine(unittest.TestCase):
+
+    def test_shard(self):
+        assert parseShard('3/10') == (3, 10)
+        for bad in ('10/10', '-1/4', '3', 'a/b'):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                parseShard(bad)
+
+    def test_extraCoords(self):
+        assert parseExtraCoords('dithered=ditheredRA,ditheredDec') == \
+            ('dithered', ('ditheredRA', 'ditheredDec'))
+
+    def test_recalcArguments(self):
+        args = _parser().parse_args(['recalc', '--input', 'opsim.db',
+                                     '--output', 'results',
+                                     '--workers', '4', '--shard', '1/2'])
+        assert args.command == 'recalc'
+        assert args.workers == 4
+        assert args.shard == (1, 2)
+        assert args.format == 'parquet'
+        assert args.coordinate_tier == 'precise'
+
+    def test_serveArguments(self):
+        args = _parser().parse_args(['serve', '--address', 'localhost:5005',
+                                     '--authkey-file', 'authkey'])
+        assert args.command == 'serve'
+        assert args.authkey_file == 'authkey'
+        assert args.authkey is None
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+from obscond import (approxSunRaDec, approxLST, airmassFromAltitude,
+                     approxAltAz, fastAltAz)
+from lsst.sims.utils import Site, ObservationMetaData, _altAzPaFromRaDec
+import numpy as np
+from numpy.testing import assert_allclose
+
+
+def test_sunRaDec_J2000():
+    # Sun at J2000.0 : RA = 18h 45m 9s, Dec = -23d 2m
+    ra, dec = approxSunRaDec(51544.5)
+    assert_allclose(ra, 281.29, atol=0.05)
+    assert_allclose(dec, -23.03, atol=0.05)
+
+
+def test_airmassFromAltitude():
+    airmass = airmassFromAltitude(np.array([90., 30., 0., -10.]))
+    assert_allclose(airmass[:2], [1.0, 2.0])
+    assert np.all(np.isinf(airmass[2:]))
+
+
+def _preciseAltAz(ra, dec, mjd, site):
+    alt = np.zeros(len(ra))
+    az = np.zeros(len(ra))
+    for i in range(len(ra)):
+        obs = ObservationMetaData(mjd=mjd[i], site=site)
+        a, z, _ = _altAzPaFromRaDec(np.radians(ra[i:i + 1]),
+                                    np.radians(dec[i:i + 1]), obs)
+        alt[i], az[i] = np.degrees(a[0]), np.degrees(z[0])
+    return alt, az
+
+
+def _separation(alt1, az1, alt2, az2):
+    alt1, az1, alt2, az2 = (np.radians(x) for x in (alt1, az1, alt2, az2))
+    cosSep = np.sin(alt1) * np.sin(alt2) + \
+        np.cos(alt1) * np.cos(alt2) * np.cos(az1 - az2)
+    return np.degrees(np.arccos(np.clip(cosSep, -1., 1.)))
+
+
+def test_altAzErrors():
+    """
+    Errors of `fastAltAz` and `approxAltAz` with respect to the precise
+    transformations of `lsst.sims.utils`, within the documented bounds for
+    airmasses below 2.5 during the survey
+    """
+    site = Site('LSST')
+    rng = np.random.RandomState(0)
+    mjd = rng.uniform(59580., 63230., 400)
+    sinDec = rng.uniform(-1., np.sin(np.radians(30.)), 400)
+    dec = np.degrees(np.arcsin(sinDec))
+    hourAngle = rng.uniform(-90., 90., 400)
+    ra = (approxLST(mjd, site.longitude) - hourAngle) % 360.
+    preciseAlt, preciseAz = _preciseAltAz(ra, dec, mjd, site)
+    preciseAirmass = airmassFromAltitude(preciseAlt)
+    sel = preciseAirmass < 2.5
+    assert sel.sum() > 100
+    for altAz, maxSep, maxAirmassFrac in ((fastAltAz, 0.04, 1.5e-3),
+                                          (approxAltAz, 0.5, 0.02)):
+        alt, az = altAz(ra, dec, mjd, site)
+        sep = _separation(alt, az, preciseAlt, preciseAz)
+        assert np.all(sep[sel] < maxSep)
+        airmassFrac = airmassFromAltitude(alt[sel]) / preciseAirmass[sel]
+        assert np.all(np.abs(airmassFrac - 1.) < maxAirmassFrac)
@@ -2,7 +2,7 @@ import obscond as oc
 import unittest
 import numpy as np
 import pandas as pd
-from pandas.util.testing import assert_frame_equal
+from pandas.testing import assert_frame_equal
 import os
 
 
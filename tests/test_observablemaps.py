@@ -0,0 +1,42 @@
+from obscond import ObservableHoursMaps
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import healpy as hp
+
+
+class TestObservableHoursMaps(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.mapDir = tempfile.mkdtemp()
+        cls.maps = ObservableHoursMaps.build(cls.mapDir, 59580.5, 59582.5,
+                                             nside=2, dt=0.5 / 24.,
+                                             minAlt=30., maxSunAlt=-18.,
+                                             pixelBlockSize=10,
+                                             timeBlockSize=16)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.mapDir)
+
+    def test_shape(self):
+        maps = ObservableHoursMaps.fromDirectory(self.mapDir)
+        self.assertEqual(maps.hours.shape, (maps.numNights, hp.nside2npix(2)))
+        np.testing.assert_array_equal(maps.hours, self.maps.hours)
+
+    def test_hours(self):
+        """
+        Hours are bounded by the length of a night, the north pole is never
+        observable and some pixels at the latitude of the site are
+        """
+        self.assertTrue(np.all(self.maps.hours >= 0.))
+        self.assertTrue(np.all(self.maps.hours <= 12.))
+        northPole = hp.ang2pix(2, 0., 0.)
+        self.assertTrue(np.all(self.maps.hours[:, northPole] == 0.))
+        self.assertTrue(np.any(self.maps.nightMap(1) > 0.))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+from obscond.observingPotential import ObservationPotential
+import unittest
+import numpy as np
+import pandas as pd
+
+
+class nightStatsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Available times at minute resolution, with two windows in night 1
+        """
+        mjd = 59580. + np.arange(0., 3., 1. / 1440.)
+        night = np.floor(mjd - 59579.6).astype(np.int64)
+        available = ((mjd % 1.) < 0.3) & ~((mjd > 59581.1) & (mjd < 59581.2))
+        cls.times = pd.DataFrame(dict(mjd=mjd, night=night))[available]
+
+    def test_minmax(self):
+        df = ObservationPotential.nightStats(self.times)
+        expected = self.times.groupby('night').mjd.agg(['min', 'max'])
+        np.testing.assert_array_equal(df.index.values, expected.index.values)
+        np.testing.assert_allclose(df.minmjd, expected['min'])
+        np.testing.assert_allclose(df.maxmjd, expected['max'])
+        np.testing.assert_allclose(df.availTime,
+                                   (df.maxmjd - df.minmjd) * 24.)
+
+    def test_windows(self):
+        df = ObservationPotential.nightStats(self.times)
+        np.testing.assert_array_equal(df.numWindows.values, [1, 2, 1])
+        self.assertAlmostEqual(df.windowTime.loc[1],
+                               df.availTime.loc[1] - 0.1 * 24.,
+                               places=3)
+
+    def test_unsorted(self):
+        shuffled = self.times.sample(frac=1., random_state=0)
+        pd.testing.assert_frame_equal(
+            ObservationPotential.nightStats(shuffled),
+            ObservationPotential.nightStats(self.times))
+
+    def test_fromBlocks(self):
+        """
+        Statistics folded over blocks, with nights and windows split across
+        blocks, agree with those of all the times at once
+        """
+        maxGap = 1.5 / 1440.
+        expected = ObservationPotential.nightStats(self.times, maxGap=maxGap)
+        for blockSize in (7, 100, 1000):
+            blocks = (self.times.iloc[start:start + blockSize]
+                      for start in range(0, len(self.times), blockSize))
+            df = ObservationPotential.nightStatsFromBlocks(blocks, maxGap)
+            pd.testing.assert_frame_equal(df, expected)
+
+
+class dc2VisitsTest(unittest.TestCase):
+
+    start_times = pd.Series([59580.1, 59581.1])
+
+    def test_pointings(self):
+        pointings = pd.DataFrame(dict(expMJD=[59580., 59581., 59582.],
+                                      rawSeeing=[0.6, 0.7, 0.8]))
+        df = ObservationPotential.dc2_visits(self.start_times, year_block=1,
+                                             pointings=pointings)
+        np.testing.assert_array_equal(np.unique(df.rawSeeing), [0.6, 0.7])
+        assert 'alt' not in df.columns
+        df = ObservationPotential.dc2_visits(self.start_times, year_block=1,
+                                             pointings=pointings,
+                                             fieldRA=np.radians(53.),
+                                             fieldDec=np.radians(-28.))
+        assert np.all((df.alt.values >= -90.) & (df.alt.values <= 90.))
+        assert np.all(np.isfinite(df.az.values))
+
+    def test_weatherDataNeedsField(self):
+        with self.assertRaises(ValueError):
+            ObservationPotential.dc2_visits(self.start_times, year_block=1,
+                                            weatherData=object())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+from obscond import readOpSimPointings, example_data_dir
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_allclose
+
+
+class TestOpSimReader(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Write the example pointings to a Summary table, with the first
+        pointing duplicated under a second proposal as in OpSim outputs
+        """
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.dbname = os.path.join(cls.tmpdir, 'opsim.db')
+        df = pd.read_csv(os.path.join(example_data_dir,
+                                      'example_pointings.csv'))
+        dup = df.iloc[:1].copy()
+        dup['propID'] = 99
+        cls.pointings = df.set_index('obsHistID')
+        conn = sqlite3.connect(cls.dbname)
+        pd.concat([df, dup]).to_sql('Summary', conn, index=False)
+        conn.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_chunksAndColumns(self):
+        chunks = list(readOpSimPointings(self.dbname, chunksize=4))
+        assert list(len(chunk) for chunk in chunks) == [4, 4, 2]
+        df = pd.concat(chunks)
+        assert list(df.columns) == ['fieldRA', 'fieldDec', 'filter',
+                                    'expMJD', 'FWHMeff']
+        expected = self.pointings.sort_index()
+        assert list(df.index) == list(expected.index)
+        assert_allclose(df.expMJD.values, expected.expMJD.values)
+
+    def test_selections(self):
+        df = pd.concat(readOpSimPointings(self.dbname, nightRange=(0, 10),
+                                          filters=['r'], propIDs=[54]))
+        expected = self.pointings.query('night <= 10 and filter == "r"')
+        assert sorted(df.index) == sorted(expected.index)
+
+    def test_shards(self):
+        shards = list(pd.concat(readOpSimPointings(self.dbname,
+                                                   shard=(i, 3)))
+                      for i in range(3))
+        index = np.concatenate(list(shard.index.values for shard in shards))
+        assert sorted(index) == sorted(self.pointings.index)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+from obscond.parquetio import (PartitionedResultsWriter,
+                               readPartitionedResults, pa)
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_allclose
+
+
+@unittest.skipIf(pa is None, 'pyarrow is not installed')
+class TestPartitionedResults(unittest.TestCase):
+
+    def setUp(self):
+        self.rootPath = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.rootPath)
+
+    @staticmethod
+    def results(start, num):
+        idx = pd.Index(np.arange(start, start + num), name='obsHistID')
+        bands = np.array(list('ugrizy'))[np.arange(num) % 6]
+        return pd.DataFrame(dict(fiveSigmaDepth=np.linspace(22., 24., num),
+                                 airmass=np.linspace(1., 2., num),
+                                 night=np.arange(num) // 4,
+                                 filter=bands),
+                            index=idx)
+
+    def test_appendAndSelect(self):
+        writer = PartitionedResultsWriter(self.rootPath,
+                                          partitionCols=('night',))
+        first = self.results(0, 12)
+        second = self.results(100, 8)
+        writer(0, first)
+        writer(1, second)
+
+        df = readPartitionedResults(self.rootPath)
+        assert len(df) == 20
+
+        df = readPartitionedResults(self.rootPath, columns=['airmass'],
+                                    nights=[1])
+        expected = pd.concat([first, second]).query('night == 1')
+        assert list(df.columns) == ['airmass']
+        assert_allclose(df.sort_index().airmass.values,
+                        expected.sort_index().airmass.values)
+
+    def test_bandFilter(self):
+        writer = PartitionedResultsWriter(self.rootPath,
+                                          partitionCols=('night', 'filter'))
+        writer.write(self.results(0, 12))
+        df = readPartitionedResults(self.rootPath,
+                                    columns=['fiveSigmaDepth'],
+                                    bands=['r'])
+        assert sorted(df.index.values) == [2, 8]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+from obscond.pipeline import PointingsPipeline
+import threading
+import time
+import unittest
+
+
+def _failOnThree(chunk):
+    if 3 in chunk:
+        raise ValueError('bad chunk')
+    return chunk
+
+
+class TestPointingsPipeline(unittest.TestCase):
+
+    def test_allChunksWritten(self):
+        chunks = list(list(range(j, j + 10))[::-1] for j in range(0, 200, 10))
+        results = dict()
+
+        def writer(j, result):
+            results[j] = result
+
+        pipeline = PointingsPipeline(sorted, numWorkers=2, maxQueueSize=1)
+        summary = pipeline.run(iter(chunks), writer)
+        assert summary['numChunks'] == len(chunks)
+        assert summary['numRows'] == 200
+        assert sorted(results) == list(range(len(chunks)))
+        for j, chunk in enumerate(chunks):
+            assert results[j] == sorted(chunk)
+
+    def test_writerErrorsPropagate(self):
+        def writer(j, result):
+            raise IOError('disk full')
+
+        pipeline = PointingsPipeline(sorted, numWorkers=1)
+        with self.assertRaises(IOError):
+            pipeline.run(iter([[2, 1], [4, 3], [6, 5]]), writer)
+
+    def test_resultsWrittenWhileReading(self):
+        written = threading.Event()
+
+        def chunks():
+            yield [2, 1]
+            # the result of the first chunk is written before the reader
+            # provides the next one
+            assert written.wait(10.)
+            yield [4, 3]
+
+        def writer(j, result):
+            written.set()
+
+        pipeline = PointingsPipeline(sorted, numWorkers=1)
+        summary = pipeline.run(chunks(), writer)
+        assert summary['numChunks'] == 2
+
+    def test_computeErrorsStopReader(self):
+        # many more chunks than the queue holds, so that the reader is
+        # blocked on the full queue when the error happens
+        chunks = list([j] for j in range(100))
+        pipeline = PointingsPipeline(_failOnThree, numWorkers=1,
+                                     maxQueueSize=1)
+        numThreads = threading.active_count()
+        start = time.time()
+        with self.assertRaises(ValueError):
+            pipeline.run(iter(chunks), lambda j, result: None)
+        assert time.time() - start < 10.
+        # the reader thread stops instead of waiting on the queue
+        time.sleep(0.5)
+        assert threading.active_count() == numThreads
+
+
+if __name__ == '__main__':
+    unittest.main()
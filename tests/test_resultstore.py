@@ -0,0 +1,62 @@
+from obscond import PointingResultStore
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from numpy.testing import assert_allclose
+
+
+class TestPointingResultStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = PointingResultStore(os.path.join(self.tmpdir,
+                                                      'results.db'))
+        self.inputs = (np.array([0.1, 0.2, 0.3]),
+                       np.array([-0.5, -0.6, -0.7]),
+                       np.array([59580.1, 59580.2, 59580.3]),
+                       np.array(['r', 'g', 'r'], dtype=object))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_keysDependOnVersion(self):
+        keys = self.store.pointingKeys(self.inputs, 'v1')
+        assert len(set(keys)) == 3
+        assert keys == self.store.pointingKeys(self.inputs, 'v1')
+        assert set(keys).isdisjoint(self.store.pointingKeys(self.inputs,
+                                                            'v2'))
+
+    def test_roundTrip(self):
+        keys = self.store.pointingKeys(self.inputs, 'v1')
+        values = np.array([[1., 2.], [3., 4.]])
+        self.store.insert(keys[:2], values)
+        assert len(self.store) == 2
+
+        found, stored = self.store.lookup(keys, 2)
+        assert list(found) == [True, True, False]
+        assert_allclose(stored[:2], values)
+        assert np.all(np.isnan(stored[2]))
+
+    def test_duplicateKeys(self):
+        keys = self.store.pointingKeys(self.inputs, 'v1')
+        self.store.insert(keys[:1], np.array([[1., 2.]]))
+        found, stored = self.store.lookup([keys[0], keys[1], keys[0]], 2)
+        assert list(found) == [True, False, True]
+        assert_allclose(stored[[0, 2]], [[1., 2.], [1., 2.]])
+
+    def test_stringInputs(self):
+        # keys of strings longer than any fixed width are distinct, and do
+        # not depend on the other rows
+        bands = np.array(['r' * 20 + 'a', 'r' * 20 + 'b', 'g'], dtype=object)
+        inputs = self.inputs[:3] + (bands,)
+        keys = self.store.pointingKeys(inputs, 'v1')
+        assert len(set(keys)) == 3
+        assert keys[2:] == self.store.pointingKeys(list(x[2:] for x in inputs),
+                                                   'v1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import obscond as oc
+import os
+import unittest
+import numpy as np
+import pandas as pd
+
+
+class seeingModelTest(unittest.TestCase):
+
+    def test_fwhmEff(self):
+        """
+        The seeing model reproduces the FWHMeff and FWHMgeom of OpSim
+        visits from their raw seeing and airmass
+        """
+        pointings = pd.read_csv(os.path.join(oc.example_data_dir,
+                                             'example_pointings.csv'),
+                                index_col='obsHistID')
+        fwhm = oc.fwhmEff(pointings.rawSeeing, pointings.airmass,
+                          pointings['filter'])
+        np.testing.assert_allclose(fwhm, pointings.FWHMeff, atol=1.0e-4)
+        np.testing.assert_allclose(oc.fwhmGeom(fwhm), pointings.FWHMgeom,
+                                   atol=1.0e-4)
+
+    def test_addSeeingConditions(self):
+        weather = oc.WeatherData.fromTxtFiles()
+        pointings = pd.DataFrame(dict(expMJD=59580. + np.arange(10) * 0.1,
+                                      filter=list('ugrizyugri'),
+                                      airmass=np.linspace(1., 2., 10)))
+        df = oc.addSeeingConditions(pointings, weather)
+        np.testing.assert_allclose(df.rawSeeing.values,
+                                   weather.seeing(np.arange(10) * 0.1,
+                                                  startDate=0.))
+        np.testing.assert_allclose(df.FWHMeff.values,
+                                   oc.fwhmEff(df.rawSeeing, df.airmass,
+                                              df['filter']))
+        self.assertNotIn('FWHMeff', pointings.columns)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+from obscond import ConditionsServer, ConditionsClient
+from multiprocessing import AuthenticationError
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import pandas as pd
+from numpy.testing import assert_allclose
+
+
+class FakeSkyCalculations(object):
+    """
+    Stand in for `SkyCalculations`, counting the calls to
+    `calculatePointings`
+    """
+    def __init__(self):
+        self.calls = 0
+
+    def calculatePointings(self, pointings, **kwargs):
+        self.calls += 1
+        return pd.DataFrame(dict(filtSkyBrightness=pointings.fieldRA + 20.,
+                                 fiveSigmaDepth=pointings.FWHMeff + 23.),
+                            index=pointings.index)
+
+
+class TestConditionsService(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.address = os.path.join(self.tmpdir, 'obscond.sock')
+        self.skycalc = FakeSkyCalculations()
+        self.server = ConditionsServer(self.skycalc, self.address,
+                                       maxDelay=0.05)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_concurrentRequestsAreBatched(self):
+        numClients = 8
+        results = dict()
+
+        def ask(i):
+            client = ConditionsClient(self.address)
+            results[i] = client.skymag('r', [0.1 * i, 0.2], 0., 59580.)
+            client.close()
+
+        threads = list(threading.Thread(target=ask, args=(i,))
+                       for i in range(numClients))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i in range(numClients):
+            assert_allclose(results[i], [20. + 0.1 * i, 20.2])
+        assert self.skycalc.calls < numClients
+
+    def test_fiveSigmaDepth(self):
+        client = ConditionsClient(self.address)
+        m5 = client.fiveSigmaDepth('g', 0.7, 0.1, -0.5, 59580.)
+        client.close()
+        assert_allclose(m5, [23.7])
+
+
+class TestConditionsServiceAuthentication(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.authkeyFile = os.path.join(self.tmpdir, 'authkey')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_portRequiresAuthkey(self):
+        with self.assertRaises(ValueError):
+            ConditionsServer(FakeSkyCalculations(), ('localhost', 0))
+
+    def test_generatedAuthkey(self):
+        server = ConditionsServer(FakeSkyCalculations(), ('localhost', 0),
+                                  authkeyFile=self.authkeyFile)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            assert os.stat(self.authkeyFile).st_mode & 0o777 == 0o600
+            client = ConditionsClient(server.address,
+                                      authkeyFile=self.authkeyFile)
+            assert_allclose(client.skymag('r', 0.3, 0., 59580.), [20.3])
+            client.close()
+            with self.assertRaises(AuthenticationError):
+                ConditionsClient(server.address, authkey=b'wrong')
+            # the server keeps serving after a failed authentication
+            client = ConditionsClient(server.address,
+                                      authkeyFile=self.authkeyFile)
+            assert_allclose(client.skymag('r', 0.4, 0., 59580.), [20.4])
+            client.close()
+        finally:
+            server.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+from obscond import (exportSkyCalculations, loadSkyCalculations, isExported,
+                     exportedVersion)
+import shutil
+import tempfile
+import unittest
+import ephem
+import numpy as np
+from numpy.testing import assert_array_equal
+
+
+class Holder(object):
+    """
+    Stand in for the objects held by `SkyCalculations`
+    """
+    def __init__(self):
+        self.templates = np.arange(100000, dtype=np.float64)
+        self.alias = dict(spec=self.templates)
+        self.small = np.arange(3)
+        self.observatory = ephem.Observer()
+        self.observatory.lat = -0.5
+        self.moon = ephem.Moon()
+
+    def modelVersion(self):
+        return 'holder-1'
+
+
+class TestSharedData(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_roundTrip(self):
+        holder = Holder()
+        assert not isExported(self.directory)
+        assert exportedVersion(self.directory) is None
+        exportSkyCalculations(holder, self.directory)
+        assert isExported(self.directory)
+        assert exportedVersion(self.directory) == 'holder-1'
+
+        loaded = loadSkyCalculations(self.directory)
+        assert isinstance(loaded.templates, np.memmap)
+        assert loaded.alias['spec'] is loaded.templates
+        assert_array_equal(loaded.templates, holder.templates)
+        assert not isinstance(loaded.small, np.memmap)
+        assert float(loaded.observatory.lat) == float(holder.observatory.lat)
+        assert isinstance(loaded.moon, ephem.Moon)
+
+    def test_writesArePrivate(self):
+        holder = Holder()
+        exportSkyCalculations(holder, self.directory)
+        loaded = loadSkyCalculations(self.directory)
+        # the arrays may be written in place, as the sky model does with its
+        # working arrays, without changing the export
+        assert loaded.templates.flags.writeable
+        loaded.templates[:10] = -1.
+        assert np.all(loaded.alias['spec'][:10] == -1.)
+        reloaded = loadSkyCalculations(self.directory)
+        assert_array_equal(reloaded.templates, holder.templates)
+
+
+if __name__ == '__main__':
+    unittest.main()
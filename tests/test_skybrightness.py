@@ -1,7 +1,16 @@
-from obscond import SkyCalculations
+from obscond import (SkyCalculations, PointingResultStore, example_data_dir,
+                     fastAltAz, airmassFromAltitude, exportSkyCalculations,
+                     loadSkyCalculations)
 from lsst.sims.photUtils import BandpassDict
+import os
+import shutil
+import healpy as hp
+import tempfile
 import unittest
-from numpy.testing import assert_almost_equal
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_almost_equal, assert_allclose
+from pandas.testing import assert_frame_equal
 
 class TestSkyBrightness(unittest.TestCase):
     totalbandpassdict, hwbandpassdict = BandpassDict.loadBandpassesFromFiles()
@@ -18,3 +27,191 @@ class TestSkyBrightness(unittest.TestCase):
                                         use_provided_airmass=True)
         assert_almost_equal(m5, 23.0601, decimal=2)
 
+    def test_ditheredPositions(self):
+        pointings = pd.read_csv(os.path.join(example_data_dir,
+                                             'example_pointings.csv'),
+                                index_col='obsHistID')
+        nominal = self.skycalc.calculatePointings(pointings)
+        both = self.skycalc.calculatePointings(pointings,
+            extraCoordCols=dict(dithered=('ditheredRA', 'ditheredDec')))
+        assert_frame_equal(both[nominal.columns], nominal)
+        assert 'ditheredFiveSigmaDepth' in both.columns
+        assert 'ditheredFiltSkyBrightness' in both.columns
+
+    def test_prefilter(self):
+        pointings = pd.read_csv(os.path.join(example_data_dir,
+                                             'example_pointings.csv'),
+                                index_col='obsHistID')
+        # a pointing in daytime, and one which never rises above the
+        # airmass limit from the LSST site
+        removed = [230, 1679570]
+        pointings.loc[230, 'expMJD'] += 0.5
+        pointings.loc[1679570, 'fieldDec'] = 1.2
+        filtered = self.skycalc.calculatePointings(pointings, fillValue=-1.)
+        unfiltered = self.skycalc.calculatePointings(pointings,
+                                                     prefilter=False,
+                                                     fillValue=-1.)
+        assert np.all(filtered.loc[removed].values == -1.)
+        assert_frame_equal(filtered.drop(removed), unfiltered.drop(removed))
+
+    def test_resultStore(self):
+        pointings = pd.read_csv(os.path.join(example_data_dir,
+                                             'example_pointings.csv'),
+                                index_col='obsHistID')
+        direct = self.skycalc.calculatePointings(pointings,
+                                                 passThroughCols=['filter'])
+        tmpdir = tempfile.mkdtemp()
+        store = PointingResultStore(os.path.join(tmpdir, 'results.db'))
+        try:
+            first = self.skycalc.calculatePointings(pointings,
+                                                    resultStore=store,
+                                                    passThroughCols=['filter'])
+            assert len(store) == len(pointings)
+            assert_frame_equal(first, direct)
+            # all results are now read from the store, including those of
+            # a repeated pointing
+            repeated = pd.concat([pointings, pointings.iloc[:1]])
+            second = self.skycalc.calculatePointings(repeated,
+                                                     resultStore=store,
+                                                     passThroughCols=['filter'])
+            assert len(store) == len(pointings)
+            assert_frame_equal(second.iloc[:-1], direct)
+            assert_frame_equal(second.iloc[-1:], direct.iloc[:1])
+        finally:
+            store.close()
+            shutil.rmtree(tmpdir)
+
+    def test_coordinateTiers(self):
+        """
+        Results of the 'fast' and 'approximate' tiers are within the
+        documented bounds of those of the 'precise' tier
+        """
+        pointings = pd.read_csv(os.path.join(example_data_dir,
+                                             'example_pointings.csv'),
+                                index_col='obsHistID')
+        precise = self.skycalc.calculatePointings(pointings)
+        sel = np.isfinite(precise.fiveSigmaDepth.values) & \
+            (precise.airmass.values < 2.5)
+        assert sel.any()
+        results = dict()
+        for tier, maxAlt, maxAirmassFrac, maxMag in (
+                ('fast', 0.04, 1.5e-3, 0.01),
+                ('approximate', 0.5, 0.02, 0.05)):
+            skycalc = SkyCalculations(photparams="LSST",
+                                      hwBandpassDict=self.hwbandpassdict,
+                                      coordinateTier=tier)
+            df = results[tier] = skycalc.calculatePointings(pointings)
+            dAlt = np.degrees(df.altitude.values - precise.altitude.values)
+            assert np.all(np.abs(dAlt[sel]) < maxAlt)
+            airmassFrac = df.airmass.values / precise.airmass.values
+            assert np.all(np.abs(airmassFrac[sel] - 1.) < maxAirmassFrac)
+            for col in ('filtSkyBrightness', 'fiveSigmaDepth'):
+                dMag = df[col].values - precise[col].values
+                assert np.all(np.abs(dMag[sel]) < maxMag)
+        # the 'fast' tier uses the coordinates of `fastAltAz`
+        alt, _ = fastAltAz(np.degrees(pointings.fieldRA.values),
+                           np.degrees(pointings.fieldDec.values),
+                           pointings.expMJD.values, self.skycalc.site)
+        assert_allclose(results['fast'].airmass.values[sel],
+                        airmassFromAltitude(alt[sel]))
+
+    def test_skyMapCache(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            cache = self.skycalc.buildSkyMapCache(tmpdir, 62086.14, 62086.16,
+                                                  nside=8, dt=0.005)
+            assert cache.numTimes == 5
+            # pointings at the centers of pixels high in the sky, at a time
+            # of the grid, where the maps need no interpolation
+            mjd = cache.mjds[2]
+            theta, phi = hp.pix2ang(cache.nside, np.arange(cache.npix))
+            ra, dec = phi, np.pi / 2. - theta
+            alt, _ = self.skycalc._altAz(np.degrees(ra), np.degrees(dec),
+                                         np.repeat(mjd, cache.npix))
+            pix = np.flatnonzero(alt > 50.)[:6]
+            pointings = pd.DataFrame(dict(fieldRA=ra[pix], fieldDec=dec[pix],
+                                          expMJD=np.repeat(mjd, len(pix)),
+                                          filter=list('ugrizy'[:len(pix)]),
+                                          FWHMeff=np.repeat(0.8, len(pix))),
+                                     index=pd.Index(np.arange(len(pix)) + 1,
+                                                    name='obsHistID'))
+            exact = self.skycalc.calculatePointings(pointings)
+            cached = self.skycalc.calculatePointingsFromCache(pointings)
+            assert_allclose(cached.filtSkyBrightness, exact.filtSkyBrightness,
+                            atol=1.0e-4)
+            flatSky = list(self.skycalc.fiveSigmaDepthFlatSky(band, skymag,
+                                                              0.8, airmass)
+                           for band, skymag, airmass in
+                           zip(pointings['filter'], cached.filtSkyBrightness,
+                               cached.airmass))
+            assert_allclose(cached.fiveSigmaDepth, flatSky, atol=1.0e-4)
+
+            # options of calculatePointings only are not passed to the cache
+            df = self.skycalc.validateSkyMapCache(pointings, prefilter=False,
+                                                  calcDepths=False)
+            assert 'dFiveSigmaDepth' not in df.columns
+            assert_allclose(df.dSkyBrightness, 0., atol=1.0e-4)
+        finally:
+            self.skycalc.skyMapCache = None
+            shutil.rmtree(tmpdir)
+
+    def test_sharedData(self):
+        pointings = pd.read_csv(os.path.join(example_data_dir,
+                                             'example_pointings.csv'),
+                                index_col='obsHistID')
+        direct = self.skycalc.calculatePointings(pointings)
+        tmpdir = tempfile.mkdtemp()
+        try:
+            exportSkyCalculations(self.skycalc, tmpdir)
+            loaded = loadSkyCalculations(tmpdir)
+            # twice, so that the working arrays written by the sky model in
+            # the first calculation are reused
+            for _ in range(2):
+                df = loaded.calculatePointings(pointings)
+                assert_frame_equal(df, direct)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_compactResults(self):
+        pointings = pd.read_csv(os.path.join(example_data_dir,
+                                             'example_pointings.csv'),
+                                index_col='obsHistID')
+        full = self.skycalc.calculatePointings(pointings)
+        compact = self.skycalc.calculatePointings(pointings, compact=True)
+        assert all(dtype == np.float32 for dtype in compact.dtypes)
+        assert compact.index.dtype == np.int64
+        assert_frame_equal(compact.astype(np.float64), full,
+                           check_exact=False, rtol=1.0e-5)
+
+    def test_threadedResults(self):
+        pointings = pd.read_csv(os.path.join(example_data_dir,
+                                             'example_pointings.csv'),
+                                index_col='obsHistID')
+        serial = self.skycalc.calculatePointings(pointings)
+        threaded = self.skycalc.calculatePointingsThreaded(pointings,
+                                                           numThreads=3,
+                                                           chunksize=3)
+        assert_frame_equal(threaded, serial)
+
+    def test_batchPhotometry(self):
+        pointings = pd.read_csv(os.path.join(example_data_dir,
+                                             'example_pointings.csv'),
+                                index_col='obsHistID')
+        cols = ['filtSkyBrightnessBatch', 'fiveSigmaDepthBatch']
+        single = self.skycalc.validateBatchPhotometry(
+            pointings, self.skycalc.batchPhotometry(precision='float64'))
+        # the differences measured on synthetic spectra are below 1.0e-4
+        assert np.nanmax(np.abs(single.dSkyBrightness)) < 1.0e-3
+        assert np.nanmax(np.abs(single.dFiveSigmaDepth)) < 1.0e-3
+        # results do not depend on the size of the batches, and float32
+        # only adds rounding errors
+        batched = self.skycalc.validateBatchPhotometry(
+            pointings, self.skycalc.batchPhotometry(precision='float64',
+                                                    batchSize=3))
+        assert_allclose(batched[cols].values, single[cols].values,
+                        rtol=1.0e-10)
+        reduced = self.skycalc.validateBatchPhotometry(
+            pointings, self.skycalc.batchPhotometry(precision='float32',
+                                                    batchSize=3))
+        assert_allclose(reduced[cols].values, single[cols].values,
+                        atol=1.0e-4)
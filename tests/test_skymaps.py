@@ -0,0 +1,51 @@
+from obscond import SkyMapCache
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from numpy.testing import assert_allclose
+
+
+class TestSkyMapCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Write a cache of maps which are constant on the sky and change
+        linearly with time
+        """
+        cls.cacheDir = tempfile.mkdtemp()
+        meta = dict(mjdStart=59580., numTimes=3, nside=4, dt=0.01,
+                    bands=['g', 'r'], maxSunAlt=-12.)
+        with open(os.path.join(cls.cacheDir, SkyMapCache.metadataFile),
+                  'w') as f:
+            json.dump(meta, f)
+        cache = SkyMapCache(cls.cacheDir, mode='w+', **meta)
+        for offset, band in enumerate(cache.bands):
+            for i in range(cache.numTimes):
+                cache.maps[band][i] = 20. + offset + i
+            cache.maps[band].flush()
+        cls.cache = SkyMapCache.fromDirectory(cls.cacheDir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.cacheDir)
+
+    def test_interpolation(self):
+        mjd = np.array([59580., 59580.005, 59580.015, 59580.02])
+        bands = np.array(['g', 'g', 'r', 'r'])
+        ra = np.array([0.1, 1.0, 2.0, 3.0])
+        dec = np.array([-0.5, 0., 0.5, -1.0])
+        skymags = self.cache.skymags(bands, ra, dec, mjd)
+        assert_allclose(skymags, [20., 20.5, 22.5, 23.], rtol=1.0e-6)
+
+    def test_outsideGrid(self):
+        skymags = self.cache.skymags(['g', 'r'], [0.1, 0.1], [0., 0.],
+                                     [59579., 59581.])
+        assert np.all(np.isnan(skymags))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import obscond as oc
+import unittest
+import os
+import tempfile
+import shutil
+import numpy as np
+import pandas as pd
+from lsst.sims.utils import Site
+
+
+class syntheticPointingsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.weather = oc.WeatherData.fromTxtFiles()
+        cls.pointings = pd.concat(oc.syntheticPointings(2500, seed=1,
+                                                        chunksize=1000,
+                                                        weatherData=cls.weather))
+
+    def test_numPointings(self):
+        self.assertEqual(len(self.pointings), 2500)
+        np.testing.assert_array_equal(self.pointings.index.values,
+                                      np.arange(1, 2501))
+
+    def test_chunksize(self):
+        """
+        The pointings do not depend on the size of the chunks
+        """
+        df = pd.concat(oc.syntheticPointings(2500, seed=1, chunksize=10,
+                                             weatherData=self.weather))
+        pd.testing.assert_frame_equal(df, self.pointings)
+
+    def test_ordering(self):
+        self.assertTrue(np.all(np.diff(self.pointings.expMJD.values) > 0.))
+        self.assertTrue(np.all(np.diff(self.pointings.night.values) >= 0))
+        self.assertTrue(np.all(self.pointings.airmass.values >= 1.))
+        self.assertTrue(np.all(self.pointings.FWHMeff.values > 0.))
+
+    def test_twilight(self):
+        """
+        All visits are taken after the evening and before the morning
+        twilight
+        """
+        site = Site('LSST')
+        mjd = self.pointings.expMJD.values
+        sunRA, sunDec = oc.approxSunRaDec(mjd)
+        sunAlt, _ = oc.fastAltAz(sunRA, sunDec, mjd, site, ofDate=True)
+        self.assertTrue(np.all(sunAlt <= -12.))
+
+    def test_writeSqlite(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(tmpdir, 'synthetic.db')
+            oc.writeSyntheticPointings(fname, 2500, seed=1, chunksize=1000,
+                                       weatherData=self.weather)
+            df = pd.concat(oc.readOpSimPointings(fname, chunksize=1000))
+            self.assertEqual(len(df), 2500)
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import obscond as oc
+import unittest
+import numpy as np
+import pandas as pd
+
+
+class M5ResidualStatsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.RandomState(0)
+        num = 5000
+        df = pd.DataFrame(dict(filter=rng.choice(list('ugrizy'), num),
+                               airmass=rng.uniform(1., 2.5, num),
+                               fiveSigmaDepth=rng.uniform(22., 25., num)))
+        df['fieldm5'] = df.fiveSigmaDepth + rng.normal(0.01, 0.02, num)
+        cls.df = df
+
+    def test_chunkedStats(self):
+        """
+        Statistics accumulated over chunks agree with those of the whole
+        set of residuals
+        """
+        stats = oc.M5ResidualStats()
+        for i in range(0, len(self.df), 700):
+            stats.update(self.df.iloc[i:i + 700])
+        summary = stats.summary()
+
+        df = self.df.copy()
+        df['resid'] = df.fieldm5 - df.fiveSigmaDepth
+        edges = stats.airmassEdges
+        df['bin'] = edges[np.searchsorted(edges, df.airmass, 'right') - 1]
+        expected = df.groupby(['filter', 'bin']).resid.agg(
+            ['count', 'mean', 'std', 'median']).reindex(summary.index)
+        np.testing.assert_array_equal(summary['count'], expected['count'])
+        np.testing.assert_allclose(summary['mean'], expected['mean'])
+        np.testing.assert_allclose(summary['std'], expected['std'])
+        np.testing.assert_allclose(summary['q50'], expected['median'],
+                                   atol=2 * stats.histBinSize)
+        self.assertEqual(summary.numOutliers.sum(),
+                         np.sum(np.abs(df.resid) > stats.outlierThreshold))
+
+    def test_merge(self):
+        stats = oc.M5ResidualStats()
+        stats.update(self.df)
+        first = oc.M5ResidualStats()
+        first.update(self.df.iloc[:1000])
+        second = oc.M5ResidualStats()
+        second.update(self.df.iloc[1000:])
+        first.merge(second)
+        pd.testing.assert_frame_equal(first.summary(), stats.summary())
+
+    def test_invalid(self):
+        df = self.df.iloc[:10].copy()
+        df.loc[df.index[:3], 'fieldm5'] = np.nan
+        df.loc[df.index[3], 'filter'] = 'x'
+        stats = oc.M5ResidualStats()
+        stats.update(df)
+        self.assertEqual(stats.numInvalid.sum(), 3)
+        self.assertEqual(stats.numSkipped, 1)
+        self.assertEqual(stats.count.sum(), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()